@@ -5,79 +5,686 @@ __date__ = '2024-07-17'
 __copyright__ = '(C) 2024 by Sanda Takeru'
 __revision__ = '$Format:%H$'
 
-import tempfile, datetime
+import tempfile, datetime, math, os, json, string, itertools, csv, heapq, pickle, sys, re, zipfile, collections, multiprocessing, gzip
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from array import array
 
-from qgis.PyQt.QtCore import QCoreApplication, QMetaType, Qt
-from qgis.PyQt.QtGui import QImage, QPixmap, QColor
+from qgis.PyQt.QtCore import QCoreApplication, QMetaType, Qt, QVariant, QDate, QDateTime, QTime, QMarginsF, QRectF
+from qgis.PyQt.QtGui import QImage, QPixmap, QColor, QPainter, QPdfWriter, QPageSize, QPageLayout, QFont
 from qgis.PyQt.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFileDialog
 from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterField, QgsProcessingParameterEnum, QgsCoordinateReferenceSystem, QgsProcessingParameterFileDestination,
-                       QgsCoordinateTransform, QgsProject, QgsProcessingOutputHtml, QgsProcessingOutputFile, QgsVectorFileWriter, QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, QgsProcessingParameterString, QgsProcessingParameterCrs, QgsProcessingParameterPoint, QgsProcessingParameterBoolean, QgsFeatureRequest)
+                       QgsCoordinateTransform, QgsProject, QgsProcessingOutputHtml, QgsProcessingOutputFile, QgsField, QgsFeature, QgsGeometry, QgsProcessingParameterString, QgsProcessingParameterCrs, QgsProcessingParameterPoint, QgsProcessingParameterBoolean, QgsFeatureRequest, QgsLineString, QgsPointXY,
+                       QgsApplication, QgsMessageLog, Qgis,
+                       QgsProcessingParameterFeatureSink, QgsFeatureSink, QgsFields, QgsProcessingParameterNumber,
+                       QgsProcessingParameterExpression, QgsProcessingParameterExtent, QgsProcessingParameterFolderDestination, QgsProcessingMultiStepFeedback)
 
 from .qrcodegen import QrCode
+from .qr_render import QrCache, qrScale, renderQrSvg, renderQrBatch
+from .route_optimizer import optimizeRoute, splitRoute, capacitatedClusters
 
 # モードレス表示したQRダイアログがGCされないよう参照を保持する
 _open_qr_dialogs = []
 
-class OnlineMapLinkerBase(QgsProcessingAlgorithm):
-    MAP_LIST = ['Google Maps', 'Apple Maps', 'Open Street Map', 'GSI Maps Japan', 'GSI Maps Vector Japan', 'Google Earth', 'Yahoo! MAP', 'Bing Maps', 'Mapion', 'MapFan']
-
-    def createCoordinateTransform(self, source_crs):
-        crs_wgs84 = QgsCoordinateReferenceSystem(4326)
-        return QgsCoordinateTransform(source_crs, crs_wgs84, QgsProject.instance())
+# Webメルカトル(EPSG:3857)の球半径
+_MERCATOR_RADIUS = 6378137.0
+
+def _mercatorToWgs84(xs, ys):
+    # EPSG:3857 -> EPSG:4326 は閉形式で配列ごと変換する
+    k = math.degrees(1.0) / _MERCATOR_RADIUS
+    lons = array('d', [x * k for x in xs])
+    lats = array('d', [math.degrees(2.0 * math.atan(math.exp(y / _MERCATOR_RADIUS)) - math.pi / 2.0) for y in ys])
+    return lons, lats
+
+def _wgs84ToMercator(xs, ys):
+    k = math.radians(1.0) * _MERCATOR_RADIUS
+    xs_out = array('d', [x * k for x in xs])
+    ys_out = array('d', [_MERCATOR_RADIUS * math.log(math.tan(math.pi / 4.0 + math.radians(y) / 2.0)) for y in ys])
+    return xs_out, ys_out
+
+# 外部マージソートで一時ファイルへ書き出す1ブロックの件数
+_SPILL_BLOCK_SIZE = 8192
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def _readSpill(spill):
+    while True:
+        try:
+            block = pickle.load(spill)
+        except EOFError:
+            return
+        yield from block
+
+def _externalSort(items, run_size):
+    # run_size件ずつ並べ替えて一時ファイルへ書き出し、heapqでマージする。件数に依らずメモリ使用量は一定
+    runs = []
+    try:
+        for run in _batched(items, run_size):
+            run.sort()
+            if not runs and len(run) < run_size:
+                # 1回分に収まる場合は書き出さずにそのまま返す
+                yield from run
+                return
+            spill = tempfile.TemporaryFile()
+            runs.append(spill)
+            for block in _batched(run, _SPILL_BLOCK_SIZE):
+                pickle.dump(block, spill, pickle.HIGHEST_PROTOCOL)
+            spill.seek(0)
+            del run
+        yield from heapq.merge(*[_readSpill(spill) for spill in runs])
+    finally:
+        for spill in runs:
+            spill.close()
+
+def _tileXY(lon, lat, zoom):
+    # WGS84経緯度を含むWebメルカトルのタイル番号(x, y)
+    n = 1 << zoom
+    lat = max(-85.05112878, min(85.05112878, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def _sortKey(value):
+    # NULLは昇順の末尾（QGISの並べ替えと同じ）。Qtの日時型は文字列にして比較・pickleできるようにする
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return (1, 0)
+    # 文字列はコードポイント順（GPKG/SQLiteのBINARY照合と同じ）。並べ替えできないプロバイダで件数がしきい値以下のときは
+    # QGISがロケール順で並べるため、大文字・小文字やかな・漢字の順がこの外部ソートと異なることがある
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        value = value.toString(Qt.DateFormat.ISODate)
+    return (0, value)
+
+# Windowsでもファイル名に使えない文字
+_INVALID_FILE_NAME_CHARS = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+def _safeFileName(value, default):
+    # 属性値をファイル名に使える文字列にする。NULL・空なら既定名
+    if value is None or (isinstance(value, QVariant) and value.isNull()):
+        return default
+    return _INVALID_FILE_NAME_CHARS.sub('_', str(value)).strip().rstrip('.') or default
+
+def _pythonExecutable():
+    # QGISに組み込まれたPythonではsys.executableがQGIS本体を指すので、同じ環境のPythonインタプリタを探す
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    names = ['pythonw.exe', 'python.exe', 'python3.exe'] if os.name == 'nt' else [f'python{sys.version_info.major}.{sys.version_info.minor}', 'python3']
+    for directory in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+def _iterOrdered(executor, func, tasks, max_pending):
+    # 投入順に結果を返す。未完了のタスクをmax_pending件までに抑え、地物数に関わらずメモリを一定にする
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(func, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class LinkTemplate:
+    # URLテンプレート。{x}(経度) {y}(緯度) {name}(名称) を置換する。生成時に一度だけ解析・検証する
+    FIELDS = ('x', 'y', 'name')
+
+    def __init__(self, map_name, template):
+        self.map_name = map_name
+        self.template = template
+        compiled = ''
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            compiled += literal.replace('{', '{{').replace('}', '}}')
+            if field is None:
+                continue
+            if field not in self.FIELDS:
+                raise ValueError(f'Unknown field "{{{field}}}" in URL template of {map_name}.')
+            compiled += '{' + str(self.FIELDS.index(field)) + ('!' + conversion if conversion else '') + (':' + spec if spec else '') + '}'
+        # 位置引数に置き換えたフォーマットのバインドメソッドを保持し、フィールド名の解決を省く
+        self._format = compiled.format
+
+    def format(self, x, y, name='Pin'):
+        return self._format(x, y, name)
+
+    def formatMany(self, xs, ys, names=None):
+        # チャンク単位でまとめて整形する
+        return list(map(self._format, xs, ys, itertools.repeat('Pin') if names is None else names))
+
+# 組み込みのオンラインマップ。ここにない地図はユーザー設定ファイル(USER_TEMPLATES_FILE)で追加できる
+BUILTIN_LINK_TEMPLATES = {
+    'Google Maps': "https://www.google.com/maps/place/{y}N+{x}E/@{y},{x},16z",
+    'Apple Maps': "https://maps.apple.com/?ll={y},{x}&q={name}&t=m",
+    'Open Street Map': "https://www.openstreetmap.org/?mlat={y}&mlon={x}#map=16/{y}/{x}",
+    'GSI Maps Japan': "https://maps.gsi.go.jp/#16/{y}/{x}",
+    'GSI Maps Vector Japan': "https://maps.gsi.go.jp/vector/#16/{y}/{x}/&ls=vstd&disp=1&d=l",
+    'Google Earth': "https://earth.google.com/web/@{y},{x},20000d",
+    'Yahoo! MAP': "https://map.yahoo.co.jp/?lat={y}&lon={x}&zoom=16&maptype=basic",
+    'Bing Maps': "https://www.bing.com/maps?cp={y}%7E{x}&lvl=16.0",
+    'Mapion': "https://www.mapion.co.jp/m2/{y},{x},16",
+    'MapFan': "https://mapfan.com/map?c={y},{x},16",
+}
+
+# ユーザー定義テンプレート: QGISプロファイル内のJSON {"地図名": "https://...{y}...{x}..."}
+USER_TEMPLATES_FILE = os.path.join('online_map_linker', 'link_templates.json')
+
+def loadLinkTemplates():
+    templates = {name: LinkTemplate(name, template) for name, template in BUILTIN_LINK_TEMPLATES.items()}
+    path = os.path.join(QgsApplication.qgisSettingsDirPath(), USER_TEMPLATES_FILE)
+    if not os.path.exists(path):
+        return templates
+    try:
+        with open(path, encoding='utf-8') as f:
+            user_templates = json.load(f)
+        if not isinstance(user_templates, dict):
+            raise ValueError('The file must contain a JSON object of "map name": "URL template".')
+    except (OSError, ValueError) as e:
+        QgsMessageLog.logMessage(f'Could not read {path}: {e}', 'Online Map Linker', Qgis.MessageLevel.Warning)
+        return templates
+    for name, template in user_templates.items():
+        try:
+            templates[name] = LinkTemplate(name, template)
+        except (ValueError, TypeError, AttributeError) as e:
+            QgsMessageLog.logMessage(f'Skipped URL template "{name}": {e}', 'Online Map Linker', Qgis.MessageLevel.Warning)
+    return templates
+
+LINK_TEMPLATES = loadLinkTemplates()
+
+# 同じURL・設定のQRコードを再利用するキャッシュ。描画済みPNGはQGISプロファイル内に容量上限付きで保存する
+QR_CACHE_DIR = os.path.join('online_map_linker', 'qr_cache')
+QR_CACHE_MAX_BYTES = 64 << 20
+QR_CACHE = QrCache(os.path.join(QgsApplication.qgisSettingsDirPath(), QR_CACHE_DIR), QR_CACHE_MAX_BYTES)
+
+class HtmlLinkWriter:
+    # バッファ付きファイルへリンクを逐次書き出す。ページ全体をメモリに保持しない
+    HEADER = "<html><head><meta charset=\"utf-8\"></head><body><h1>Online Map Linker</h1>"
+    FOOTER = '<p>Generated by the QGIS plugin "<a href="https://plugins.qgis.org/plugins/online_map_linker/" target="_blank">Online Map Linker</a>".</p></body></html>'
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._in_list = False
+
+    def __enter__(self):
+        self._file = open(self.path, 'w', encoding='utf-8', buffering=self.BUFFER_SIZE)
+        self._file.write(self.HEADER)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.endList()
+                self._file.write(self.FOOTER)
+        finally:
+            self._file.close()
+        return False
+
+    def beginList(self):
+        if not self._in_list:
+            self._file.write("<ul>\n")
+            self._in_list = True
+
+    def endList(self):
+        if self._in_list:
+            self._file.write("</ul>")
+            self._in_list = False
+
+    def writeListItems(self, items):
+        # items: (リンク, 表示名) の反復。チャンク単位でまとめて書き込む
+        self.beginList()
+        self._file.writelines(f"<li><a href='{link}'>{text}</a></li>\n" for link, text in items)
+
+    def writeLink(self, link, text):
+        self.endList()
+        self._file.write(f'<p><a href="{link}" target="_blank">{text}</a></p>')
+
+    def writeNavigation(self, links):
+        # links: (リンク, 表示名) の反復。ページ間の相対リンクを1行に並べる
+        self.endList()
+        self._file.write('<p>' + ' | '.join(f'<a href="{link}">{text}</a>' for link, text in links) + '</p>\n')
+
+class CsvLinkWriter:
+    # 地物を読みながらCSVへ1行ずつ書き出す。出力レイヤをメモリ上に作らない
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, path, encoding='cp932', errors='strict'):
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w', encoding=self.encoding, errors=self.errors, newline='', buffering=self.BUFFER_SIZE)
+        self._writer = csv.writer(self._file)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        return False
+
+    def writeHeader(self, field_names):
+        self._writer.writerow(field_names)
+
+    def writeRows(self, rows):
+        self._writer.writerows([[self.formatValue(value) for value in row] for row in rows])
+
+    @staticmethod
+    def formatValue(value):
+        # OGRのCSVドライバと同じ表記にそろえる（NULLは空欄、日付はyyyy/MM/dd、真偽値は1/0）
+        if value is None or (isinstance(value, QVariant) and value.isNull()):
+            return ''
+        if isinstance(value, QDateTime):
+            return value.toString('yyyy/MM/dd hh:mm:ss')
+        if isinstance(value, QDate):
+            return value.toString('yyyy/MM/dd')
+        if isinstance(value, QTime):
+            return value.toString('hh:mm:ss')
+        if isinstance(value, bool):
+            return int(value)
+        return value
+
+class JsonLinkWriter:
+    # 地物を読みながら1行1レコードのJSON(NDJSON)を書き出す。gzip圧縮にも対応
+    BUFFER_SIZE = 1 << 16
+    GZIP_LEVEL = 6
+
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.compress = compress
+        self._file = None
+        # 日本語はそのまま、区切りの空白は省く。JSONにない型は文字列にする
+        # NaN・Infinityは正しいJSONではないので、formatValueでnullにしたうえで混入すればエラーにする
+        self._encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str, allow_nan=False).encode
+
+    def __enter__(self):
+        if self.compress:
+            self._file = gzip.open(self.path, 'wt', compresslevel=self.GZIP_LEVEL, encoding='utf-8', newline='\n')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8', newline='\n', buffering=self.BUFFER_SIZE)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        return False
+
+    def writeRecords(self, records):
+        self._file.writelines(self._encode(record) + '\n' for record in records)
+
+    @staticmethod
+    def formatValue(value):
+        # NULLと有限でない実数(NaN・Infinity)はnull、日付・時刻はISO 8601の文字列
+        if value is None or (isinstance(value, QVariant) and value.isNull()):
+            return None
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        if isinstance(value, (QDate, QDateTime, QTime)):
+            return value.toString(Qt.DateFormat.ISODate)
+        return value
+
+class ImageFileWriter:
+    # 画像をフォルダへ1ファイルずつ、またはZIPアーカイブ1つにまとめて書き出す
+    def __init__(self, folder, archive_path=None):
+        self.folder = folder
+        self.archive_path = archive_path
+        self._archive = None
+        self._used_names = set()
+
+    def __enter__(self):
+        os.makedirs(self.folder, exist_ok=True)
+        if self.archive_path:
+            self._archive = zipfile.ZipFile(self.archive_path, 'w', zipfile.ZIP_DEFLATED)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._archive is not None:
+            self._archive.close()
+        return False
+
+    def uniqueName(self, base, extension):
+        # 同名(大文字小文字は区別しない)があれば _2, _3 ... を付ける
+        name, n = base + extension, 1
+        while name.lower() in self._used_names:
+            n += 1
+            name = f'{base}_{n}{extension}'
+        self._used_names.add(name.lower())
+        return name
+
+    def write(self, file_name, data):
+        if self._archive is not None:
+            # PNGは圧縮済みなので無圧縮で格納する。SVGはテキストなので圧縮する
+            self._archive.writestr(file_name, data, zipfile.ZIP_STORED if file_name.lower().endswith('.png') else zipfile.ZIP_DEFLATED)
+        else:
+            with open(os.path.join(self.folder, file_name), 'wb') as f:
+                f.write(data)
 
-    def getSortedFeatures(self, point_layer, sort_field):
+class OnlineMapLinkerBase(QgsProcessingAlgorithm):
+    MAP_LIST = list(LINK_TEMPLATES)
+
+    # 一括座標変換・一括書き込みでまとめて処理する地物数
+    TRANSFORM_CHUNK_SIZE = 10000
+    CHUNK_SIZE = 'chunk_size'
+
+    def addChunkSizeParameter(self):
+        param = QgsProcessingParameterNumber(self.CHUNK_SIZE, 'Features per batch (coordinate transformation and writing)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=self.TRANSFORM_CHUNK_SIZE, minValue=1)
+        param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+        self.addParameter(param)
+
+    def parameterAsChunkSize(self, parameters, context):
+        return self.parameterAsInt(parameters, self.CHUNK_SIZE, context) if self.CHUNK_SIZE in parameters else self.TRANSFORM_CHUNK_SIZE
+
+    def createPointTransformer(self, source_crs, dest_crs=None):
+        # (xs, ys)の配列をまとめて変換する関数を返す。既定の変換先はWGS84
+        dest_crs = dest_crs if dest_crs is not None else QgsCoordinateReferenceSystem(4326)
+        if source_crs == dest_crs:
+            return lambda xs, ys: (xs, ys)
+        if source_crs.authid() == 'EPSG:3857' and dest_crs.authid() == 'EPSG:4326':
+            return _mercatorToWgs84
+        if source_crs.authid() == 'EPSG:4326' and dest_crs.authid() == 'EPSG:3857':
+            return _wgs84ToMercator
+        transform = QgsCoordinateTransform(source_crs, dest_crs, QgsProject.instance())
+
+        def transformer(xs, ys):
+            # チャンク全体を1本のラインにして1回の呼び出しで変換する（地物ごとのSIP往復を避ける）
+            line = QgsLineString(list(xs), list(ys))
+            line.transform(transform)
+            return array('d', line.xVector()), array('d', line.yVector())
+        return transformer
+
+    def iterPointChunks(self, features, chunk_size=None):
+        # 地物をチャンクにまとめ、元座標を連続配列にして(地物リスト, xs, ys)で返す
+        chunk_size = chunk_size or self.TRANSFORM_CHUNK_SIZE
+        chunk, xs, ys = [], array('d'), array('d')
+        for feature in features:
+            point = feature.geometry().asPoint()
+            chunk.append(feature)
+            xs.append(point.x())
+            ys.append(point.y())
+            if len(chunk) >= chunk_size:
+                yield chunk, xs, ys
+                chunk, xs, ys = [], array('d'), array('d')
+        if chunk:
+            yield chunk, xs, ys
+
+    FILTER_EXPRESSION = 'filter_expression'
+    EXTENT = 'extent'
+
+    def addFeatureFilterParameters(self):
+        # 「選択地物のみ」は入力レイヤパラメータ標準のチェックボックスで指定でき、地物IDのフィルタとしてプロバイダに渡される
+        params = [
+            QgsProcessingParameterExpression(self.FILTER_EXPRESSION, 'Filter expression', parentLayerParameterName=self.POINT_LAYER, defaultValue=None, optional=True),
+            QgsProcessingParameterExtent(self.EXTENT, 'Only features within extent', defaultValue=None, optional=True),
+        ]
+        for param in params:
+            param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+            self.addParameter(param)
+
+    # QRコードのエンコード設定
+    QR_ECC = 'qr_ecc'
+    QR_MASK = 'qr_mask'
+    QR_BOOST_ECL = 'qr_boost_ecl'
+    QR_BORDER = 'qr_border'
+    QR_DISK_CACHE = 'qr_disk_cache'
+    # (表示名, 誤り訂正レベル)
+    QR_ECC_LIST = [('Low (~7%)', QrCode.Ecc.LOW), ('Medium (~15%)', QrCode.Ecc.MEDIUM), ('Quartile (~25%)', QrCode.Ecc.QUARTILE), ('High (~30%)', QrCode.Ecc.HIGH)]
+    # (表示名, マスク番号, 評価するマスク候補, 打ち切るペナルティ/モジュール)。-1は自動選択
+    # 高速モードはURLで最良になりやすいマスクから順に評価し、十分低いペナルティが出た時点で止める
+    QR_MASK_LIST = [('Automatic (best of all 8 masks)', -1, None, None), ('Fast automatic (first good mask of 2, 3, 6, 0)', -1, (2, 3, 6, 0), 1.0)] + [(f'Fixed mask {i}', i, None, None) for i in range(8)]
+
+    def addQrParameters(self):
+        params = [
+            QgsProcessingParameterEnum(self.QR_ECC, 'QR error correction level', options=[label for label, _ in self.QR_ECC_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=1),
+            QgsProcessingParameterBoolean(self.QR_BOOST_ECL, 'Raise the error correction level if the QR code stays the same size', defaultValue=True),
+            QgsProcessingParameterEnum(self.QR_MASK, 'QR mask pattern', options=[label for label, *_ in self.QR_MASK_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=0),
+            QgsProcessingParameterNumber(self.QR_BORDER, 'QR quiet zone (modules)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=4, minValue=0, maxValue=20),
+        ]
+        for param in params:
+            param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+            self.addParameter(param)
+
+    def addQrCacheParameter(self):
+        param = QgsProcessingParameterBoolean(self.QR_DISK_CACHE, 'Reuse QR images cached in the QGIS profile', defaultValue=True)
+        param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+        self.addParameter(param)
+
+    def parameterAsQrOptions(self, parameters, context):
+        # generateQrImageのキーワード引数として渡す
+        _label, mask, mask_candidates, penalty_threshold = self.QR_MASK_LIST[self.parameterAsEnum(parameters, self.QR_MASK, context)]
+        return {
+            'ecl': self.QR_ECC_LIST[self.parameterAsEnum(parameters, self.QR_ECC, context)][1],
+            'boostecl': self.parameterAsBool(parameters, self.QR_BOOST_ECL, context),
+            'mask': mask,
+            'maskcandidates': mask_candidates,
+            'penaltythreshold': penalty_threshold,
+            'border': self.parameterAsInt(parameters, self.QR_BORDER, context),
+        }
+
+    # QRコードの一括描画に使うワーカープロセス
+    WORKERS = 'workers'
+    # ワーカーへ1回で渡すQRコードの数と、ワーカー1つ当たりの未完了タスク数の上限
+    QR_TASK_SIZE = 64
+    QR_PENDING_PER_WORKER = 4
+
+    def addWorkersParameter(self):
+        param = QgsProcessingParameterNumber(self.WORKERS, 'Worker processes (0 = number of CPUs, 1 = no parallel processing)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=0, minValue=0)
+        param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+        self.addParameter(param)
+
+    def parameterAsWorkers(self, parameters, context):
+        return self.parameterAsInt(parameters, self.WORKERS, context) or os.cpu_count() or 1
+
+    def createProcessPool(self, workers, feedback):
+        # 失敗したらNoneを返し、呼び出し側は逐次処理に切り替える
+        python = _pythonExecutable()
+        if python is None:
+            feedback.pushWarning('Python interpreter for worker processes not found. Running without parallel processing.')
+            return None
+        mp_context = multiprocessing.get_context('spawn')
+        mp_context.set_executable(python)
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context)
+        try:
+            # 空のタスクでワーカーが起動し、このモジュールを読み込めることを確かめる
+            executor.submit(renderQrBatch, ({}, [])).result()
+        except (BrokenProcessPool, OSError) as e:
+            executor.shutdown(wait=False, cancel_futures=True)
+            feedback.pushWarning(f'Could not start worker processes ({e}). Running without parallel processing.')
+            return None
+        return executor
+
+    def writeQrImages(self, writer, tasks, workers, feedback, total):
+        # tasks: renderQrBatchに渡す(エンコード設定, [(ファイル名, テキスト), ...])の反復。書き出した数を返す
+        executor = self.createProcessPool(workers, feedback) if workers > 1 else None
+        count = 0
+        try:
+            if executor is not None:
+                results = _iterOrdered(executor, renderQrBatch, tasks, workers * self.QR_PENDING_PER_WORKER)
+            else:
+                results = map(renderQrBatch, tasks)
+            for rendered in results:
+                for file_name, data in rendered:
+                    writer.write(file_name, data)
+                count += len(rendered)
+                feedback.setProgress(min(100, count * 100 / total))
+                if feedback.isCanceled():
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+        return count
+
+    # 並べ替えをSQLへ渡せるプロバイダ（OGRはGeoPackage/SQLiteのみ）
+    SORTING_PROVIDERS = ('postgres', 'spatialite', 'mssql', 'oracle', 'hana')
+    SORTING_OGR_FORMATS = ('GPKG', 'SQLite')
+    # プロバイダが並べ替えできず、地物数がこれを超えるときは外部マージソートを使う
+    EXTERNAL_SORT_THRESHOLD = 200000
+    EXTERNAL_SORT_RUN_SIZE = 500000
+    EXTERNAL_SORT_FETCH_SIZE = 5000
+
+    def providerCanSort(self, layer):
+        if layer is None or layer.dataProvider() is None:
+            return False
+        provider = layer.dataProvider()
+        if provider.name() in self.SORTING_PROVIDERS:
+            return True
+        return provider.name() == 'ogr' and provider.storageType() in self.SORTING_OGR_FORMATS
+
+    def getSortedFeatures(self, point_layer, sort_field, attributes=None, filter_expression=None, extent=None, expression_context=None, provider_can_sort=True):
+        # attributes: 取得する列名のリスト（Noneなら全列）。列・行の絞り込みはデータプロバイダへ渡す
+        request = QgsFeatureRequest()
+        if attributes is not None:
+            columns = [name for name in attributes if name]
+            if sort_field and sort_field not in columns:
+                columns.append(sort_field)
+            request.setSubsetOfAttributes(columns, point_layer.fields())
+        if filter_expression:
+            request.setFilterExpression(filter_expression)
+            if expression_context is not None:
+                request.setExpressionContext(expression_context)
+        if extent is not None and not extent.isNull():
+            request.setFilterRect(extent)
         if sort_field:
+            if not provider_can_sort and point_layer.featureCount() > self.EXTERNAL_SORT_THRESHOLD:
+                # QGISのクライアント側ソートは全地物をメモリに載せるため、外部ソートに切り替える
+                return self.iterExternallySortedFeatures(point_layer, sort_field, request)
             order_by_clause = QgsFeatureRequest.OrderByClause(sort_field)
             order_by = QgsFeatureRequest.OrderBy([order_by_clause])
-            request = QgsFeatureRequest().setOrderBy(order_by)
-            return point_layer.getFeatures(request)
-        return point_layer.getFeatures()
-
-    def generateLinkFunction(self, map_name):
-        if (map_name == 'Google Maps'):
-            return lambda x, y, name: f"https://www.google.com/maps/place/{y}N+{x}E/@{y},{x},16z"
-        elif (map_name == 'Apple Maps'):
-            return lambda x, y, name: f"https://maps.apple.com/?ll={y},{x}&q={name}&t=m"
-        elif (map_name == 'Open Street Map'):
-            return lambda x, y, name: f"https://www.openstreetmap.org/?mlat={y}&mlon={x}#map=16/{y}/{x}"
-        elif (map_name == 'GSI Maps Japan'):
-            return lambda x, y, name: f"https://maps.gsi.go.jp/#16/{y}/{x}"
-        elif (map_name == 'GSI Maps Vector Japan'):
-            return lambda x, y, name: f"https://maps.gsi.go.jp/vector/#16/{y}/{x}/&ls=vstd&disp=1&d=l"
-        elif (map_name == 'Google Earth'):
-            return lambda x, y, name: f"https://earth.google.com/web/@{y},{x},20000d"
-        elif (map_name == 'Yahoo! MAP'):
-            return lambda x, y, name: f"https://map.yahoo.co.jp/?lat={y}&lon={x}&zoom=16&maptype=basic"
-        elif (map_name == 'Bing Maps'):
-            return lambda x, y, name: f"https://www.bing.com/maps?cp={y}%7E{x}&lvl=16.0"
-        elif (map_name == 'Mapion'):
-            return lambda x, y, name: f"https://www.mapion.co.jp/m2/{y},{x},16"
-        elif (map_name == 'MapFan'):
-            return lambda x, y, name: f"https://mapfan.com/map?c={y},{x},16"
+            request.setOrderBy(order_by)
+        return point_layer.getFeatures(request)
+
+    def iterExternallySortedFeatures(self, point_layer, sort_field, request):
+        # 1回目: (並べ替えキー, 地物ID)だけを読み、外部マージソートする
+        key_request = QgsFeatureRequest(request)
+        key_request.setSubsetOfAttributes([sort_field], point_layer.fields())
+        if key_request.filterRect().isNull():
+            key_request.setFlags(key_request.flags() | Qgis.FeatureRequestFlag.NoGeometry)
+        keys = ((_sortKey(feature[sort_field]), feature.id()) for feature in point_layer.getFeatures(key_request))
+        sorted_fids = (fid for _key, fid in _externalSort(keys, self.EXTERNAL_SORT_RUN_SIZE))
+
+        # 2回目: 並べ替えた順に地物IDでまとめて取り出し、その順で返す
+        for fids in _batched(sorted_fids, self.EXTERNAL_SORT_FETCH_SIZE):
+            fetch_request = QgsFeatureRequest()
+            fetch_request.setFilterFids(fids)
+            if request.flags() & Qgis.FeatureRequestFlag.SubsetOfAttributes:
+                fetch_request.setSubsetOfAttributes(request.subsetOfAttributes())
+            fetched = {feature.id(): feature for feature in point_layer.getFeatures(fetch_request)}
+            for fid in fids:
+                if fid in fetched:
+                    yield fetched[fid]
+
+    def getSourceFeatures(self, parameters, context, point_layer, sort_field, attributes=None):
+        # アルゴリズムの絞り込みパラメータを読み取り、必要な列だけを取得する
+        filter_expression = self.parameterAsExpression(parameters, self.FILTER_EXPRESSION, context)
+        extent = self.parameterAsExtent(parameters, self.EXTENT, context, point_layer.sourceCrs()) if parameters.get(self.EXTENT) else None
+        expression_context = self.createExpressionContext(parameters, context, point_layer) if filter_expression else None
+        provider_can_sort = self.providerCanSort(self.parameterAsVectorLayer(parameters, self.POINT_LAYER, context)) if sort_field else True
+        return self.getSortedFeatures(point_layer, sort_field, attributes, filter_expression, extent, expression_context, provider_can_sort)
+
+    # 複数地点の経路(Google Maps)
+    OPTIMIZE_ORDER = 'optimize_order'
+    DEPOT = 'depot'
+    SPLIT_ROUTE = 'split_route'
+    ROUTE_URL = 'https://www.google.co.jp/maps/dir'
+    # Google Mapsの経路は出発地を含めて合計10地点まで
+    ROUTE_MAX_POINTS = 10
+    # 分割して巡回順を最適化するときの最大地点数（2000地点で1秒弱）。最適化しなければ上限はない
+    ROUTE_MAX_STOPS = 2000
+
+    def addRoutingParameters(self):
+        self.addParameter(QgsProcessingParameterBoolean(self.OPTIMIZE_ORDER, 'Optimise the stop order for the shortest route (Sort Field is ignored)', defaultValue=False))
+        self.addParameter(QgsProcessingParameterPoint(self.DEPOT, 'Depot (first stop of the route)', defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(self.SPLIT_ROUTE, f'Split routes over {self.ROUTE_MAX_POINTS} points into consecutive legs (one link each)', defaultValue=False))
+
+    def getRouteUrls(self, parameters, context, feedback, point_layer, sort_field, current_location):
+        # 経路URLのリストを返す。分割しなければ1つ
+        optimize = self.parameterAsBool(parameters, self.OPTIMIZE_ORDER, context)
+        split = self.parameterAsBool(parameters, self.SPLIT_ROUTE, context)
+        depot = self.parameterAsPoint(parameters, self.DEPOT, context, QgsCoordinateReferenceSystem(4326)) if parameters.get(self.DEPOT) else None
+
+        # 分割しない場合、現在地スタート時は現在地が、デポを指定した場合はデポが1地点ずつ消費する
+        if not split:
+            max_points = self.ROUTE_MAX_POINTS - (1 if current_location else 0) - (1 if depot is not None else 0)
         else:
+            max_points = self.ROUTE_MAX_STOPS if optimize else None
+        if point_layer.featureCount() == 0:
+            error_msg = 'The layer has no features. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+
+        # 経路には座標だけを使うので属性は取得しない。絞り込み後の件数で上限を判定する。最適化するなら並べ替えは不要
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        features = list(itertools.islice(self.getSourceFeatures(parameters, context, point_layer, None if optimize else sort_field, []), None if max_points is None else max_points + 1))
+        if len(features) == 0:
+            error_msg = 'No features match the filter. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+        elif max_points is not None and len(features) > max_points:
+            error_msg = f'The layer has over {max_points} features. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+
+        lons, lats = array('d'), array('d')
+        if depot is not None:
+            lons.append(depot.x())
+            lats.append(depot.y())
+        for _chunk, xs, ys in self.iterPointChunks(features):
+            xs, ys = transformer(xs, ys)
+            lons.extend(xs)
+            lats.extend(ys)
+        # 最適化はパスごとに中断を確認する。中断されたら空のリストを返す
+        order = optimizeRoute(lons, lats, fixed_start=depot is not None, is_canceled=feedback.isCanceled) if optimize else range(len(lons))
+        if feedback.isCanceled():
+            return []
+        stops = [f"/{lats[i]},{lons[i]}" for i in order]
+
+        # 出発地を空にすると現在地が始点になる（.../dir//lat,lon/...）。2つ目以降の区間は前の区間の終点から出発する
+        legs = splitRoute(stops, self.ROUTE_MAX_POINTS, current_location)
+        return [self.ROUTE_URL + ('/' if current_location and n == 0 else '') + ''.join(leg) for n, leg in enumerate(legs)]
+
+    def addOnlineMapsParameter(self):
+        # 複数の地図を選ぶと、レイヤの読み込み・座標変換は1回のまま地図ごとのリンクを作る
+        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Maps', options=self.MAP_LIST, allowMultiple=True, usesStaticStrings=False, defaultValue=[self.MAP_LIST.index('Open Street Map')]))
+
+    def parameterAsMapNames(self, parameters, context, feedback):
+        map_names = [self.MAP_LIST[i] for i in self.parameterAsEnums(parameters, self.ONLINE_MAP, context)]
+        if not map_names:
+            error_msg = 'No online maps selected. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+        return map_names
+
+    def getLinkTemplate(self, map_name):
+        if map_name not in LINK_TEMPLATES:
             raise Exception('No online maps found. Exiting process.')
+        return LINK_TEMPLATES[map_name]
 
-    def generateQrImage(self, text, target_px=720, border=4):
+    def generateQrImage(self, text, target_px=720, border=4, ecl=QrCode.Ecc.MEDIUM, boostecl=True, mask=-1, maskcandidates=None, penaltythreshold=None, disk_cache=False):
         # 純PythonのQRジェネレータでマトリクスを作り、QImageに黒い四角を描画する
-        # 情報量(モジュール数)に関わらず原寸をほぼ一定の高解像度にし、モジュールは整数px(=くっきり)にする
-        qr = QrCode.encode_text(text, QrCode.Ecc.MEDIUM)
-        size = qr.get_size()
-        scale = max(1, target_px // (size + border * 2))
-        img_size = (size + border * 2) * scale
-        image = QImage(img_size, img_size, QImage.Format.Format_RGB32)
-        image.fill(QColor(255, 255, 255))
-        black = QColor(0, 0, 0).rgb()
-        for y in range(size):
-            for x in range(size):
-                if qr.get_module(x, y):
-                    px0 = (x + border) * scale
-                    py0 = (y + border) * scale
-                    for dy in range(scale):
-                        for dx in range(scale):
-                            image.setPixel(px0 + dx, py0 + dy, black)
+        # 同じURL・設定なら、ディスクキャッシュのPNGを読むか、メモリ上の符号化済みマトリクスを再利用する
+        if disk_cache:
+            image = QImage.fromData(QR_CACHE.renderPng(text, target_px, border, ecl, boostecl, mask, maskcandidates, penaltythreshold), 'PNG')
+            if not image.isNull():
+                return image
+        qr = QR_CACHE.encode(text, ecl, boostecl, mask, maskcandidates, penaltythreshold)
+        scale = qrScale(qr, target_px, border)
+        img_size = (qr.get_size() + border * 2) * scale
+        # 余白込み・拡大済みの1ビット/画素ビットマップを一括で受け取る。行は32ビット境界にそろえる
+        stride = (img_size + 31) // 32 * 4
+        bitmap = qr.get_bitmap(border, scale, rowalign=4)
+        image = QImage(bitmap, img_size, img_size, stride, QImage.Format.Format_Mono).copy()
+        image.setColorTable([QColor(255, 255, 255).rgb(), QColor(0, 0, 0).rgb()])
         return image
 
+    def generateQrSvg(self, text, target_px=720, border=4, ecl=QrCode.Ecc.MEDIUM, boostecl=True, mask=-1, maskcandidates=None, penaltythreshold=None):
+        # 直前のgenerateQrImageと同じURL・設定ならメモリキャッシュのマトリクスを使う
+        return renderQrSvg(QR_CACHE.encode(text, ecl, boostecl, mask, maskcandidates, penaltythreshold), target_px, border)
+
 class OnlineMapLinkerHTML(OnlineMapLinkerBase):
     OUTPUT = 'OUTPUT'
     INPUT = 'INPUT'
@@ -86,47 +693,153 @@ class OnlineMapLinkerHTML(OnlineMapLinkerBase):
     POINT_LAYER = 'point_layer'
     ONLINE_MAP = 'online_map'
     HTML_PATH = 'html_path'
+    LINKS_PER_PAGE = 'links_per_page'
+    INDEX_GROUPING = 'index_grouping'
+    TILE_ZOOM = 'tile_zoom'
+    INDEX_GROUPING_LIST = ['Sort field ranges', 'Map tiles']
+    # 並行して書き出すページ数
+    PAGE_WRITERS = 4
+    # 索引の項目数の上限。ページが多い場合は連続する複数ページを1項目にまとめる
+    INDEX_MAX_ENTRIES = 100
 
     def initAlgorithm(self, config):
         self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
-        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addOnlineMapsParameter()
         self.addParameter(QgsProcessingParameterField(self.NAME_FIELD, 'Name Field - If blank, the coordinates will be used.', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
         self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(self.LINKS_PER_PAGE, 'Links per page (0 = all links on one page; otherwise the output is an index page)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=0, minValue=0))
+        self.addParameter(QgsProcessingParameterEnum(self.INDEX_GROUPING, 'Group pages in the index by', options=self.INDEX_GROUPING_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue=0))
+        param = QgsProcessingParameterNumber(self.TILE_ZOOM, 'Map tile zoom level for grouping', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=12, minValue=0, maxValue=20)
+        param.setFlags(param.flags() | Qgis.ProcessingParameterFlag.Advanced)
+        self.addParameter(param)
         self.addParameter(QgsProcessingParameterFileDestination(self.HTML_PATH, 'HTML Output', fileFilter='HTML files (*.html)', defaultValue=None))
         self.addOutput(QgsProcessingOutputHtml(self.OUTPUT, 'Online Map Linker (HTML) output'))
+        self.addFeatureFilterParameters()
 
     def processAlgorithm(self, parameters, context, feedback):
         point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
-        online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        map_names = self.parameterAsMapNames(parameters, context, feedback)
         name_field = self.parameterAsString(parameters, self.NAME_FIELD, context)
         sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
         html_path = self.parameterAsString(parameters, self.HTML_PATH, context)
+        links_per_page = self.parameterAsInt(parameters, self.LINKS_PER_PAGE, context)
+        tile_grouping = self.parameterAsEnum(parameters, self.INDEX_GROUPING, context) == 1
+        tile_zoom = self.parameterAsInt(parameters, self.TILE_ZOOM, context)
 
         if point_layer.featureCount() == 0:
             error_msg = 'The layer has no features. Exiting process.'
             feedback.reportError(error_msg)
             raise Exception(error_msg)
 
-        transform = self.createCoordinateTransform(point_layer.sourceCrs())
-        features = self.getSortedFeatures(point_layer, sort_field)
-
-        link_function = self.generateLinkFunction(self.MAP_LIST[online_map])
-
-        html_output = "<html><head><meta charset=\"utf-8\"></head><body><h1>Online Map Linker</h1><ul>\n"
-        for feature in features:
-            geometry = feature.geometry()
-            geometry.transform(transform)
-            x, y = geometry.asPoint().x(), geometry.asPoint().y()
-            name = feature[name_field] if name_field else f"{x}, {y}"
-            link = link_function(x, y, name)
-            html_output += f"<li><a href='{link}'>{name} ({self.MAP_LIST[online_map]})</a></li>\n"
-        html_output += '</ul><p>Generated by the QGIS plugin "<a href="https://plugins.qgis.org/plugins/online_map_linker/" target="_blank">Online Map Linker</a>".</p></body></html>'
-
-        output_filepath = tempfile.gettempdir() + '/OML('+self.MAP_LIST[online_map]+')_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.html' if 'html_path.html' in html_path else html_path
-        with open(output_filepath, 'w', encoding='utf-8') as f:
-            f.write(html_output)
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        # タイルでまとめる場合は後でタイル順に並べ替えるので、ここでの並べ替えは不要
+        features = self.getSourceFeatures(parameters, context, point_layer, None if links_per_page and tile_grouping else sort_field, [name_field])
+
+        link_templates = [self.getLinkTemplate(map_name) for map_name in map_names]
+
+        def iterLinks(xs, ys, names):
+            # 地物ごとに、選んだ地図のリンクを順に並べる: (名称, リンク, 表示名)
+            per_map = [link_template.formatMany(xs, ys, names) for link_template in link_templates]
+            for name, links in zip(names, zip(*per_map)):
+                for map_name, link in zip(map_names, links):
+                    yield name, link, f"{name} ({map_name})"
+
+        output_filepath = tempfile.gettempdir() + '/OML('+'+'.join(map_names)+')_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.html' if 'html_path.html' in html_path else html_path
+        if links_per_page:
+            def iterItems():
+                # (グループ, リンク, 表示名)。グループは索引に載せる並べ替えフィールドの値、またはタイル
+                for chunk, xs, ys in self.iterPointChunks(features):
+                    if feedback.isCanceled():
+                        return
+                    xs, ys = transformer(xs, ys)
+                    names = [feature[name_field] for feature in chunk] if name_field else [f"{x}, {y}" for x, y in zip(xs, ys)]
+                    if tile_grouping:
+                        groups = [_tileXY(x, y, tile_zoom) for x, y in zip(xs, ys)]
+                    else:
+                        groups = [feature[sort_field] for feature in chunk] if sort_field else names
+                    # 同じ地物のリンクは同じグループ
+                    groups = itertools.chain.from_iterable(itertools.repeat(group, len(map_names)) for group in groups)
+                    yield from ((group, link, text) for group, (_name, link, text) in zip(groups, iterLinks(xs, ys, names)))
+
+            if tile_grouping:
+                # タイル順に外部ソートする（同じタイル内は元の順）。ページはタイルの境目で区切らず、タイル順にlinks_per_page件ずつ詰める
+                keyed = ((group, n, link, text) for n, (group, link, text) in enumerate(iterItems()))
+                items = ((f'{tile_zoom}/{x}/{y}', link, text) for (x, y), _n, link, text in _externalSort(keyed, self.EXTERNAL_SORT_RUN_SIZE))
+            else:
+                items = iterItems()
+            self.writeHtmlPages(output_filepath, items, links_per_page, feedback, point_layer.featureCount() * len(map_names))
+            return {self.OUTPUT: output_filepath}
+
+        with HtmlLinkWriter(output_filepath) as writer:
+            writer.beginList()
+            for chunk, xs, ys in self.iterPointChunks(features):
+                xs, ys = transformer(xs, ys)
+                names = [feature[name_field] for feature in chunk] if name_field else [f"{x}, {y}" for x, y in zip(xs, ys)]
+                writer.writeListItems((link, text) for _name, link, text in iterLinks(xs, ys, names))
         return {self.OUTPUT: output_filepath}
 
+    def writeHtmlPages(self, index_path, items, links_per_page, feedback, total):
+        # items: (グループ, リンク, 表示名)の反復。links_per_page件ごとにページを分けて「<出力名>_pages」フォルダへ書き出し、
+        # 出力ファイルはページ範囲とそのグループ範囲を見出しにした索引にする。リンクはすべて相対パス
+        page_dir = os.path.splitext(index_path)[0] + '_pages'
+        os.makedirs(page_dir, exist_ok=True)
+        index_link = '../' + os.path.basename(index_path)
+        pages = []  # (ファイル名, 最初のグループ, 最後のグループ)。ページの中身は保持しない
+
+        def pageName(number):
+            return f'page_{number:05d}.html'
+
+        def writePage(number, page_items, has_next):
+            navigation = [(pageName(number - 1), 'Previous')] if number > 1 else []
+            navigation.append((index_link, 'Index'))
+            if has_next:
+                navigation.append((pageName(number + 1), 'Next'))
+            with HtmlLinkWriter(os.path.join(page_dir, pageName(number))) as writer:
+                writer.writeNavigation(navigation)
+                writer.writeListItems((link, text) for _group, link, text in page_items)
+                writer.writeNavigation(navigation)
+
+        # 「次へ」の有無は次のページが始まるまで分からないので、1ページ遅れで書き出しへ回す
+        # 書き出し待ちのページ数を抑え、地物数に関わらずメモリを一定にする
+        with ThreadPoolExecutor(max_workers=self.PAGE_WRITERS) as executor:
+            pending = collections.deque()
+            previous = None
+
+            def submit(page_items, has_next):
+                pages.append((pageName(len(pages) + 1), page_items[0][0], page_items[-1][0]))
+                pending.append(executor.submit(writePage, len(pages), page_items, has_next))
+                if len(pending) > self.PAGE_WRITERS * 2:
+                    pending.popleft().result()
+                feedback.setProgress(min(100, len(pages) * links_per_page * 100 / total))
+
+            current = []
+            for item in items:
+                if len(current) >= links_per_page:
+                    if previous is not None:
+                        submit(previous, True)
+                    previous, current = current, []
+                current.append(item)
+            if current:
+                if previous is not None:
+                    submit(previous, True)
+                previous = current
+            if previous is not None:
+                submit(previous, False)
+            for future in pending:
+                future.result()
+
+        # 索引はINDEX_MAX_ENTRIES項目以内。各項目は範囲の先頭ページへリンクし、以降は各ページの「次へ」でたどる
+        pages_per_entry = max(1, math.ceil(len(pages) / self.INDEX_MAX_ENTRIES))
+        entries = []
+        for start in range(0, len(pages), pages_per_entry):
+            section = pages[start:start + pages_per_entry]
+            first, last = section[0][1], section[-1][2]
+            numbers = f'Page {start + 1}' if len(section) == 1 else f'Pages {start + 1}–{start + len(section)}'
+            entries.append((os.path.basename(page_dir) + '/' + section[0][0], f'{numbers}: {first}' + ('' if last == first else f' – {last}')))
+        with HtmlLinkWriter(index_path) as writer:
+            writer.writeListItems(entries)
+        feedback.pushInfo(f'{len(pages)} pages written to {page_dir}.')
+
     def name(self):
         return 'Online Map Linker (HTML)'
 
@@ -152,61 +865,149 @@ class OnlineMapLinkerCSV(OnlineMapLinkerBase):
     POINT_LAYER = 'point_layer'
     ONLINE_MAP = 'online_map'
     CSV_PATH = 'csv_path'
+    ENCODING = 'encoding'
+    ENCODING_ERRORS = 'encoding_errors'
+    # (表示名, Pythonのコーデック名)
+    # Shift_JISはWindowsの拡張(髙・﨑・①・～など)を含むcp932で書く。厳密なshift_jisではこれらの文字で止まってしまう
+    ENCODING_LIST = [('Shift_JIS (CP932)', 'cp932'), ('UTF-8', 'utf-8'), ('UTF-8 with BOM', 'utf-8-sig'), ('EUC-JP', 'euc_jp')]
+    ENCODING_ERRORS_LIST = [('Stop with an error', 'strict'), ('Replace with "?"', 'replace'), ('Drop the character', 'ignore'), ('Write as XML character reference (&#NNNN;)', 'xmlcharrefreplace')]
 
     def initAlgorithm(self, config):
         self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
-        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addOnlineMapsParameter()
         self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.ENCODING, 'Encoding', options=[label for label, _ in self.ENCODING_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=0))
+        self.addParameter(QgsProcessingParameterEnum(self.ENCODING_ERRORS, 'Characters that cannot be encoded', options=[label for label, _ in self.ENCODING_ERRORS_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=0))
         self.addParameter(QgsProcessingParameterFileDestination(self.CSV_PATH, 'CSV Output', fileFilter='CSV files (*.csv)', defaultValue=None))
+        self.addFeatureFilterParameters()
+        self.addChunkSizeParameter()
         self.addOutput(QgsProcessingOutputFile(self.OUTPUT, 'Online Map Linker (CSV) output'))
 
     def processAlgorithm(self, parameters, context, feedback):
         point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
-        online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        map_names = self.parameterAsMapNames(parameters, context, feedback)
         sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
         csv_path = self.parameterAsString(parameters, self.CSV_PATH, context)
+        encoding_label, encoding = self.ENCODING_LIST[self.parameterAsEnum(parameters, self.ENCODING, context)]
+        encoding_errors = self.ENCODING_ERRORS_LIST[self.parameterAsEnum(parameters, self.ENCODING_ERRORS, context)][1]
+        chunk_size = self.parameterAsChunkSize(parameters, context)
 
         if point_layer.featureCount() == 0:
             error_msg = 'The layer has no features. Exiting process.'
             feedback.reportError(error_msg)
             raise Exception(error_msg)
 
-        transform = self.createCoordinateTransform(point_layer.sourceCrs())
-        features = self.getSortedFeatures(point_layer, sort_field)
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        features = self.getSourceFeatures(parameters, context, point_layer, sort_field)
+
+        link_templates = [self.getLinkTemplate(map_name) for map_name in map_names]
+
+        field_names = point_layer.fields().names()
+        oml_fields = ["OML_" + map_name for map_name in map_names]
+
+        output_filepath = tempfile.gettempdir() + '/OML('+'+'.join(map_names)+')_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.csv' if 'csv_path.csv' in csv_path else csv_path
+        try:
+            with CsvLinkWriter(output_filepath, encoding, encoding_errors) as writer:
+                writer.writeHeader(field_names + oml_fields)
+                for chunk, xs, ys in self.iterPointChunks(features, chunk_size):
+                    xs, ys = transformer(xs, ys)
+                    # 地図ごとにチャンク分のURLをまとめて作り、地物ごとに列として並べる
+                    links = zip(*[link_template.formatMany(xs, ys) for link_template in link_templates])
+                    writer.writeRows(feature.attributes() + list(feature_links) for feature, feature_links in zip(chunk, links))
+        except UnicodeEncodeError as e:
+            error_msg = f'"{e.object[e.start:e.end]}" cannot be encoded in {encoding_label}. Choose another encoding or another option for characters that cannot be encoded. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+        return {self.OUTPUT: output_filepath}
 
-        link_function = self.generateLinkFunction(self.MAP_LIST[online_map])
+    def name(self):
+        return 'Online Map Linker (CSV)'
 
-        source_crs = point_layer.sourceCrs()
-        output_layer = QgsVectorLayer(f"Point?crs={source_crs.authid()}", "online map linked", "memory")
-        output_layer_data = output_layer.dataProvider()
-        output_layer_data.addAttributes(point_layer.fields().toList())
-        output_layer.updateFields()
+    def displayName(self):
+        return self.tr(self.name())
 
-        oml_field = "OML_" + self.MAP_LIST[online_map]
-        output_layer.dataProvider().addAttributes([QgsField(oml_field, QMetaType.Type.QString)])
-        output_layer.updateFields()
+    def group(self):
+        return None
 
-        for feature in features:
-            wgs84_point = transform.transform(feature.geometry().asPoint())
-            x, y = wgs84_point.x(), wgs84_point.y()
-            link = link_function(x, y, "Pin")
-            new_feature = QgsFeature(output_layer.fields())
-            new_feature.setGeometry(feature.geometry())
-            for field in point_layer.fields():
-                new_feature[field.name()] = feature[field.name()]
-            new_feature[oml_field] = link
-            output_layer_data.addFeatures([new_feature])
-
-        output_filepath = tempfile.gettempdir() + '/OML('+self.MAP_LIST[online_map]+')_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.csv' if 'csv_path.csv' in csv_path else csv_path
-        output_layer.updateFields()
-        csv_options = QgsVectorFileWriter.SaveVectorOptions()
-        csv_options.driverName = 'CSV'
-        csv_options.fileEncoding = 'Shift_JIS'
-        QgsVectorFileWriter.writeAsVectorFormatV3(output_layer, output_filepath, QgsProject.instance().transformContext(), csv_options)
+    def groupId(self):
+        return None
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return OnlineMapLinkerCSV()
+
+class OnlineMapLinkerNDJSON(OnlineMapLinkerBase):
+    SORT_FIELD = 'sort_field'
+    POINT_LAYER = 'point_layer'
+    ONLINE_MAP = 'online_map'
+    FIELDS = 'fields'
+    GZIP = 'gzip'
+    JSON_PATH = 'json_path'
+    OUTPUT = 'OUTPUT'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addOnlineMapsParameter()
+        self.addParameter(QgsProcessingParameterField(self.FIELDS, 'Attributes to include - If blank, all attributes will be included.', parentLayerParameterName=self.POINT_LAYER, allowMultiple=True, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterBoolean(self.GZIP, 'Compress with gzip (.gz)', defaultValue=False))
+        self.addParameter(QgsProcessingParameterFileDestination(self.JSON_PATH, 'NDJSON Output', fileFilter='NDJSON files (*.ndjson)', defaultValue=None))
+        self.addFeatureFilterParameters()
+        self.addChunkSizeParameter()
+        self.addOutput(QgsProcessingOutputFile(self.OUTPUT, 'Online Map Linker (NDJSON) output'))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
+        map_names = self.parameterAsMapNames(parameters, context, feedback)
+        field_names = self.parameterAsStrings(parameters, self.FIELDS, context) or point_layer.fields().names()
+        sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
+        compress = self.parameterAsBool(parameters, self.GZIP, context)
+        json_path = self.parameterAsString(parameters, self.JSON_PATH, context)
+        chunk_size = self.parameterAsChunkSize(parameters, context)
+
+        if point_layer.featureCount() == 0:
+            error_msg = 'The layer has no features. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        features = self.getSourceFeatures(parameters, context, point_layer, sort_field, field_names)
+        link_templates = [self.getLinkTemplate(map_name) for map_name in map_names]
+        # 取得しない列はNULLで返るので、選んだ列の位置だけを拾う
+        field_indices = [point_layer.fields().indexOf(name) for name in field_names]
+        format_value = JsonLinkWriter.formatValue
+
+        output_filepath = tempfile.gettempdir() + '/OML_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.ndjson' if 'json_path.ndjson' in json_path else json_path
+        if compress and not output_filepath.endswith('.gz'):
+            output_filepath += '.gz'
+        total = point_layer.featureCount()
+        count = 0
+        with JsonLinkWriter(output_filepath, compress) as writer:
+            for chunk, xs, ys in self.iterPointChunks(features, chunk_size):
+                if feedback.isCanceled():
+                    break
+                xs, ys = transformer(xs, ys)
+                # 地図ごとにチャンク分のURLをまとめて作り、地物ごとに組み合わせる
+                links = zip(*[link_template.formatMany(xs, ys) for link_template in link_templates])
+                records = []
+                for feature, x, y, urls in zip(chunk, xs, ys, links):
+                    attributes = feature.attributes()
+                    records.append({
+                        'fid': feature.id(),
+                        'lon': format_value(x),
+                        'lat': format_value(y),
+                        'attributes': {name: format_value(attributes[i]) for name, i in zip(field_names, field_indices)},
+                        'links': dict(zip(map_names, urls)),
+                    })
+                writer.writeRecords(records)
+                count += len(chunk)
+                feedback.setProgress(min(100, count * 100 / total))
         return {self.OUTPUT: output_filepath}
 
     def name(self):
-        return 'Online Map Linker (CSV)'
+        return 'Online Map Linker (NDJSON)'
 
     def displayName(self):
         return self.tr(self.name())
@@ -221,7 +1022,7 @@ class OnlineMapLinkerCSV(OnlineMapLinkerBase):
         return QCoreApplication.translate('Processing', string)
 
     def createInstance(self):
-        return OnlineMapLinkerCSV()
+        return OnlineMapLinkerNDJSON()
 
 class OnlineMapLinkerLayer(OnlineMapLinkerBase):
     OUTPUT = 'OUTPUT'
@@ -234,61 +1035,59 @@ class OnlineMapLinkerLayer(OnlineMapLinkerBase):
 
     def initAlgorithm(self, config):
         self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
-        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addOnlineMapsParameter()
         self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
         self.addParameter(QgsProcessingParameterCrs(self.OUTPUT_CRS, 'Output CRS', defaultValue='ProjectCrs'))
-        self.addParameter(QgsProcessingParameterFileDestination(self.LAYER_PATH, 'Layer Output', fileFilter='GeoPackage file (*.gpkg)', defaultValue=None))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.LAYER_PATH, 'Layer Output', type=QgsProcessing.SourceType.TypeVectorPoint, defaultValue=None))
+        self.addFeatureFilterParameters()
+        self.addChunkSizeParameter()
 
     def processAlgorithm(self, parameters, context, feedback):
         point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
-        online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        map_names = self.parameterAsMapNames(parameters, context, feedback)
         sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
-        layer_path = self.parameterAsString(parameters, self.LAYER_PATH, context)
         output_crs = self.parameterAsCrs(parameters, self.OUTPUT_CRS, context)
+        chunk_size = self.parameterAsChunkSize(parameters, context)
 
         if point_layer.featureCount() == 0:
             error_msg = 'The layer has no features. Exiting process.'
             feedback.reportError(error_msg)
             raise Exception(error_msg)
 
-        transform = self.createCoordinateTransform(point_layer.sourceCrs())
-        geom_transform = QgsCoordinateTransform(point_layer.sourceCrs(), output_crs, QgsProject.instance())
-        features = self.getSortedFeatures(point_layer, sort_field)
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        geom_transformer = self.createPointTransformer(point_layer.sourceCrs(), output_crs)
+        features = self.getSourceFeatures(parameters, context, point_layer, sort_field)
 
-        link_function = self.generateLinkFunction(self.MAP_LIST[online_map])
+        link_templates = [self.getLinkTemplate(map_name) for map_name in map_names]
 
-        output_layer = QgsVectorLayer(f"Point?crs={output_crs.authid()}", "online map linked", "memory")
-        output_layer_data = output_layer.dataProvider()
-        output_layer_data.addAttributes(point_layer.fields().toList())
-        output_layer.updateFields()
+        output_fields = QgsFields(point_layer.fields())
+        for map_name in map_names:
+            output_fields.append(QgsField("OML_" + map_name, QMetaType.Type.QString))
 
-        oml_field = "OML_" + self.MAP_LIST[online_map]
-        output_layer.dataProvider().addAttributes([QgsField(oml_field, QMetaType.Type.QString)])
-        output_layer.updateFields()
+        # Processingのシンクへ直接書き出す（メモリレイヤを経由せず、モデルやバッチ処理にも連結できる）
+        sink, dest_id = self.parameterAsSink(parameters, self.LAYER_PATH, context, output_fields, Qgis.WkbType.Point, output_crs)
+        if sink is None:
+            error_msg = self.invalidSinkError(parameters, self.LAYER_PATH)
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
 
-        for feature in features:
-            source_pt = feature.geometry().asPoint()
-            wgs84_point = transform.transform(source_pt)
-            x, y = wgs84_point.x(), wgs84_point.y()
-            link = link_function(x, y, "Pin")
-            out_pt = geom_transform.transform(source_pt)
-            new_feature = QgsFeature(output_layer.fields())
-            new_feature.setGeometry(QgsGeometry.fromPointXY(out_pt))
-            for field in point_layer.fields():
-                new_feature[field.name()] = feature[field.name()]
-            new_feature[oml_field] = link
-            output_layer_data.addFeatures([new_feature])
-
-        if layer_path == QgsProcessing.TEMPORARY_OUTPUT or 'layer_path' in layer_path:
-            output_layer.setName('online_map_linked')
-            QgsProject.instance().addMapLayer(output_layer)
-        else:
-            layer_options = QgsVectorFileWriter.SaveVectorOptions()
-            layer_options.driverName = 'GPKG'
-            layer_options.fileEncoding = 'UTF-8'
-            QgsVectorFileWriter.writeAsVectorFormatV3(output_layer, layer_path, QgsProject.instance().transformContext(), layer_options)
-            QgsProject.instance().addMapLayer(QgsVectorLayer(layer_path, 'online_map_linked', 'ogr'))
-        return {self.OUTPUT: layer_path}
+        for chunk, source_xs, source_ys in self.iterPointChunks(features, chunk_size):
+            xs, ys = transformer(source_xs, source_ys)
+            out_xs, out_ys = geom_transformer(source_xs, source_ys)
+            new_features = []
+            # 地図ごとにチャンク分のURLをまとめて作る（読み込み・座標変換は地図の数に関わらず1回）
+            links = zip(*[link_template.formatMany(xs, ys) for link_template in link_templates])
+            for feature, feature_links, out_x, out_y in zip(chunk, links, out_xs, out_ys):
+                new_feature = QgsFeature(output_fields)
+                new_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(out_x, out_y)))
+                # 属性はフィールド名で1つずつ引かず、配列ごとコピーしてリンクを末尾に足す
+                new_feature.setAttributes(feature.attributes() + list(feature_links))
+                new_features.append(new_feature)
+            sink.addFeatures(new_features, QgsFeatureSink.Flag.FastInsert)
+
+        if context.willLoadLayerOnCompletion(dest_id):
+            context.layerToLoadOnCompletionDetails(dest_id).name = 'online_map_linked'
+        return {self.LAYER_PATH: dest_id}
 
     def name(self):
         return 'Online Map Linker (Layer)'
@@ -318,12 +1117,14 @@ class OnlineMapLinkerMulti(OnlineMapLinkerBase):
     CURRENT_LOCATION = 'current_location'
 
     def initAlgorithm(self, config):
-        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links (Up to 10 features, or 9 if starting from current location.)', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links (Up to 10 features, or 9 if starting from current location, unless the route is split.)', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
         self.addParameter(QgsProcessingParameterBoolean(self.CURRENT_LOCATION, 'Start from current location (the device that opens the link)', defaultValue=True))
         self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addRoutingParameters()
         self.addParameter(QgsProcessingParameterString(self.URL_TITLE, 'URL Title', defaultValue=None, optional=True))
         self.addParameter(QgsProcessingParameterFileDestination(self.HTML_PATH, 'HTML Output', fileFilter='HTML files (*.html)', defaultValue=None))
         self.addOutput(QgsProcessingOutputHtml(self.OUTPUT, 'Online Map Linker "Multi-destination routing" (HTML) output'))
+        self.addFeatureFilterParameters()
 
     def processAlgorithm(self, parameters, context, feedback):
         point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
@@ -332,41 +1133,227 @@ class OnlineMapLinkerMulti(OnlineMapLinkerBase):
         url_title = self.parameterAsString(parameters, self.URL_TITLE, context)
         current_location = self.parameterAsBool(parameters, self.CURRENT_LOCATION, context)
 
-        # Google Mapsの経路は合計10地点まで。現在地スタート時は現在地が1地点を消費するためレイヤは9点まで
-        max_points = 9 if current_location else 10
-        feature_count = point_layer.featureCount()
-        if feature_count == 0:
+        urls = self.getRouteUrls(parameters, context, feedback, point_layer, sort_field, current_location)
+        if feedback.isCanceled():
+            return {}
+
+        output_filepath = tempfile.gettempdir() + '/OML(Google Maps)_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.html' if 'html_path.html' in html_path else html_path
+        with HtmlLinkWriter(output_filepath) as writer:
+            if len(urls) == 1:
+                writer.writeLink(urls[0], url_title if url_title else urls[0])
+            else:
+                for n, url in enumerate(urls, 1):
+                    writer.writeLink(url, f'{url_title if url_title else "Route"} ({n}/{len(urls)})')
+        return {self.OUTPUT: output_filepath}
+
+    def name(self):
+        return 'Multi-destination routing (HTML, Google Maps)'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return None
+
+    def groupId(self):
+        return None
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return OnlineMapLinkerMulti()
+
+class OnlineMapLinkerClusterRoutes(OnlineMapLinkerBase):
+    POINT_LAYER = 'point_layer'
+    CURRENT_LOCATION = 'current_location'
+    CAPACITY = 'capacity'
+    OUTPUT = 'OUTPUT'
+    QR_FOLDER = 'qr_folder'
+    CLUSTER_FIELD = 'OML_cluster'
+    STOP_FIELD = 'OML_stop'
+    ROUTE_FIELD = 'OML_route'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating routes', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addParameter(QgsProcessingParameterBoolean(self.CURRENT_LOCATION, 'Start from current location (the device that opens the link)', defaultValue=True))
+        self.addParameter(QgsProcessingParameterNumber(self.CAPACITY, f'Stops per route (up to {self.ROUTE_MAX_POINTS}, or {self.ROUTE_MAX_POINTS - 1} if starting from current location)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=self.ROUTE_MAX_POINTS, minValue=1, maxValue=self.ROUTE_MAX_POINTS))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, 'Routes', type=QgsProcessing.SourceType.TypeVectorPoint, defaultValue=None))
+        self.addParameter(QgsProcessingParameterFolderDestination(self.QR_FOLDER, 'QR codes of the routes (one PNG per route)', defaultValue=None, optional=True, createByDefault=False))
+        self.addFeatureFilterParameters()
+        self.addQrParameters()
+        self.addWorkersParameter()
+
+    def processAlgorithm(self, parameters, context, feedback):
+        point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
+        current_location = self.parameterAsBool(parameters, self.CURRENT_LOCATION, context)
+        # 現在地スタート時は現在地が1地点を消費する
+        capacity = min(self.parameterAsInt(parameters, self.CAPACITY, context), self.ROUTE_MAX_POINTS - (1 if current_location else 0))
+        qr_folder = self.parameterAsString(parameters, self.QR_FOLDER, context)
+
+        if point_layer.featureCount() == 0:
             error_msg = 'The layer has no features. Exiting process.'
             feedback.reportError(error_msg)
             raise Exception(error_msg)
-        elif feature_count > max_points:
-            error_msg = f'The layer has over {max_points} features. Exiting process.'
+
+        steps = QgsProcessingMultiStepFeedback(4 if qr_folder else 3, feedback)
+        # 1回目: 座標と地物IDだけを読み、経緯度の配列にする
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        fids, lons, lats = [], array('d'), array('d')
+        total = point_layer.featureCount()
+        for chunk, xs, ys in self.iterPointChunks(self.getSourceFeatures(parameters, context, point_layer, None, [])):
+            if feedback.isCanceled():
+                return {}
+            xs, ys = transformer(xs, ys)
+            fids.extend(feature.id() for feature in chunk)
+            lons.extend(xs)
+            lats.extend(ys)
+            steps.setProgress(min(100, len(fids) * 100 / total))
+        if len(fids) == 0:
+            error_msg = 'No features match the filter. Exiting process.'
             feedback.reportError(error_msg)
             raise Exception(error_msg)
 
-        transform = self.createCoordinateTransform(point_layer.sourceCrs())
-        features = self.getSortedFeatures(point_layer, sort_field)
+        # 近い地点をcapacity個ずつにまとめ、まとまりごとに巡回順を最適化して経路URLを作る
+        # まとまりは1つずつ作られるので、受け取るたびに中断を確認する
+        steps.setCurrentStep(1)
+        memberships = {}
+        urls = []
+        for cluster_id, members in enumerate(capacitatedClusters(lons, lats, capacity), 1):
+            if feedback.isCanceled():
+                return {}
+            order = [members[i] for i in optimizeRoute([lons[i] for i in members], [lats[i] for i in members])]
+            urls.append(self.ROUTE_URL + ('/' if current_location else '') + ''.join(f"/{lats[i]},{lons[i]}" for i in order))
+            for stop, i in enumerate(order, 1):
+                memberships[fids[i]] = (cluster_id, stop)
+            steps.setProgress(len(memberships) * 100 / len(fids))
+        feedback.pushInfo(f'{len(fids)} stops grouped into {len(urls)} routes.')
+
+        # 2回目: 全属性を読み、経路番号・訪問順・経路URLを付けてシンクへ書き出す
+        steps.setCurrentStep(2)
+        output_fields = QgsFields(point_layer.fields())
+        output_fields.append(QgsField(self.CLUSTER_FIELD, QMetaType.Type.Int))
+        output_fields.append(QgsField(self.STOP_FIELD, QMetaType.Type.Int))
+        output_fields.append(QgsField(self.ROUTE_FIELD, QMetaType.Type.QString))
+        sink, dest_id = self.parameterAsSink(parameters, self.OUTPUT, context, output_fields, point_layer.wkbType(), point_layer.sourceCrs())
+        if sink is None:
+            error_msg = self.invalidSinkError(parameters, self.OUTPUT)
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+        count = 0
+        for chunk in _batched(self.getSourceFeatures(parameters, context, point_layer, None), self.TRANSFORM_CHUNK_SIZE):
+            if feedback.isCanceled():
+                return {}
+            new_features = []
+            for feature in chunk:
+                membership = memberships.get(feature.id())
+                if membership is None:
+                    continue
+                cluster_id, stop = membership
+                new_feature = QgsFeature(output_fields)
+                new_feature.setGeometry(feature.geometry())
+                new_feature.setAttributes(feature.attributes() + [cluster_id, stop, urls[cluster_id - 1]])
+                new_features.append(new_feature)
+            sink.addFeatures(new_features, QgsFeatureSink.Flag.FastInsert)
+            count += len(chunk)
+            steps.setProgress(min(100, count * 100 / total))
+
+        if qr_folder:
+            steps.setCurrentStep(3)
+            qr_options = self.parameterAsQrOptions(parameters, context)
+            jobs = ((f'route_{cluster_id}.png', url) for cluster_id, url in enumerate(urls, 1))
+            with ImageFileWriter(qr_folder) as writer:
+                self.writeQrImages(writer, ((qr_options, batch) for batch in _batched(jobs, self.QR_TASK_SIZE)), self.parameterAsWorkers(parameters, context), steps, len(urls))
+
+        if context.willLoadLayerOnCompletion(dest_id):
+            context.layerToLoadOnCompletionDetails(dest_id).name = 'online_map_routes'
+        return {self.OUTPUT: dest_id, self.QR_FOLDER: qr_folder or None}
 
-        URL = 'https://www.google.co.jp/maps/dir'
-        if current_location:
-            # 出発地を空にすると現在地が始点になる（.../dir//lat,lon/...）
-            URL += '/'
-        for feature in features:
-            geometry = feature.geometry()
-            geometry.transform(transform)
-            x, y = geometry.asPoint().x(), geometry.asPoint().y()
-            URL += f"/{y},{x}"
+    def name(self):
+        return 'Multi-destination routes for clustered points (Google Maps)'
 
-        link_text = f'<p><a href="{URL}" target="_blank">{url_title}</a></p>' if url_title else f'<p><a href="{URL}" target="_blank">{URL}</a></p>'
-        html_output = f"<html><head><meta charset=\"utf-8\"></head><body><h1>Online Map Linker</h1>{link_text}<p>Generated by the QGIS plugin \"<a href=\"https://plugins.qgis.org/plugins/online_map_linker/\" target=\"_blank\">Online Map Linker</a>\".</p></body></html>"
+    def displayName(self):
+        return self.tr(self.name())
 
-        output_filepath = tempfile.gettempdir() + '/OML(Google Maps)_'+datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S')+'.html' if 'html_path.html' in html_path else html_path
-        with open(output_filepath, 'w', encoding='utf-8') as f:
-            f.write(html_output)
-        return {self.OUTPUT: output_filepath}
+    def group(self):
+        return None
+
+    def groupId(self):
+        return None
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return OnlineMapLinkerClusterRoutes()
+
+class OnlineMapLinkerBatchQR(OnlineMapLinkerBase):
+    NAME_FIELD = 'name_field'
+    POINT_LAYER = 'point_layer'
+    ONLINE_MAP = 'online_map'
+    OUTPUT_FOLDER = 'output_folder'
+    ZIP_ARCHIVE = 'zip_archive'
+    IMAGE_SIZE = 'image_size'
+    IMAGE_FORMAT = 'image_format'
+    # (表示名, 拡張子)
+    IMAGE_FORMAT_LIST = [('PNG (1-bit raster)', 'png'), ('SVG (vector, scales to any print size)', 'svg')]
+    ARCHIVE = 'ARCHIVE'
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating QR codes', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addParameter(QgsProcessingParameterField(self.NAME_FIELD, 'File Name Field - If blank, the feature ID will be used.', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(self.IMAGE_SIZE, 'Image size (px)', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=720, minValue=21))
+        self.addParameter(QgsProcessingParameterEnum(self.IMAGE_FORMAT, 'Image format', options=[label for label, _ in self.IMAGE_FORMAT_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean(self.ZIP_ARCHIVE, 'Write a single ZIP archive instead of separate image files', defaultValue=False))
+        self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_FOLDER, 'Output folder', defaultValue=None))
+        self.addOutput(QgsProcessingOutputFile(self.ARCHIVE, 'ZIP archive'))
+        self.addFeatureFilterParameters()
+        self.addQrParameters()
+        self.addWorkersParameter()
+
+    def processAlgorithm(self, parameters, context, feedback):
+        point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
+        online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        name_field = self.parameterAsString(parameters, self.NAME_FIELD, context)
+        output_folder = self.parameterAsString(parameters, self.OUTPUT_FOLDER, context)
+        zip_archive = self.parameterAsBool(parameters, self.ZIP_ARCHIVE, context)
+        workers = self.parameterAsWorkers(parameters, context)
+        qr_options = self.parameterAsQrOptions(parameters, context)
+        qr_options['target_px'] = self.parameterAsInt(parameters, self.IMAGE_SIZE, context)
+        image_format = self.IMAGE_FORMAT_LIST[self.parameterAsEnum(parameters, self.IMAGE_FORMAT, context)][1]
+        qr_options['image_format'] = image_format
+
+        total = point_layer.featureCount()
+        if total == 0:
+            error_msg = 'The layer has no features. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        features = self.getSourceFeatures(parameters, context, point_layer, None, [name_field])
+        link_template = self.getLinkTemplate(self.MAP_LIST[online_map])
+        archive_path = os.path.join(output_folder, 'OML_QR(' + self.MAP_LIST[online_map] + ').zip') if zip_archive else None
+
+        with ImageFileWriter(output_folder, archive_path) as writer:
+            def iterTasks():
+                # ファイル名の重複解消はメインプロセスで行い、ワーカーにはURLの符号化と描画だけを渡す
+                for chunk, xs, ys in self.iterPointChunks(features):
+                    if feedback.isCanceled():
+                        return
+                    xs, ys = transformer(xs, ys)
+                    names = [feature[name_field] for feature in chunk] if name_field else None
+                    links = link_template.formatMany(xs, ys, names)
+                    file_names = [writer.uniqueName(_safeFileName(feature[name_field] if name_field else None, str(feature.id())), '.' + image_format) for feature in chunk]
+                    for batch in _batched(zip(file_names, links), self.QR_TASK_SIZE):
+                        yield qr_options, batch
+
+            count = self.writeQrImages(writer, iterTasks(), workers, feedback, total)
+        feedback.pushInfo(f'{count} QR codes written.')
+        return {self.OUTPUT_FOLDER: output_folder, self.ARCHIVE: archive_path}
 
     def name(self):
-        return 'Multi-destination routing (HTML, Google Maps)'
+        return 'Online Map Linker (QR code, batch)'
 
     def displayName(self):
         return self.tr(self.name())
@@ -381,16 +1368,148 @@ class OnlineMapLinkerMulti(OnlineMapLinkerBase):
         return QCoreApplication.translate('Processing', string)
 
     def createInstance(self):
-        return OnlineMapLinkerMulti()
+        return OnlineMapLinkerBatchQR()
+
+class OnlineMapLinkerQRSheet(OnlineMapLinkerBase):
+    NAME_FIELD = 'name_field'
+    SORT_FIELD = 'sort_field'
+    POINT_LAYER = 'point_layer'
+    ONLINE_MAP = 'online_map'
+    PAGE_SIZE = 'page_size'
+    COLUMNS = 'columns'
+    ROWS = 'rows'
+    MARGIN = 'margin'
+    PDF_PATH = 'pdf_path'
+    # (表示名, 用紙サイズ)
+    PAGE_SIZE_LIST = [('A4', QPageSize.PageSizeId.A4), ('A3', QPageSize.PageSizeId.A3), ('Letter', QPageSize.PageSizeId.Letter)]
+    # PDFの解像度(dpi)とラベルの文字サイズ(pt)
+    RESOLUTION = 300
+    CAPTION_POINT_SIZE = 8
+
+    def initAlgorithm(self, config):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating QR codes', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addParameter(QgsProcessingParameterField(self.NAME_FIELD, 'Caption Field - If blank, the coordinates will be used.', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.PAGE_SIZE, 'Page size', options=[label for label, _ in self.PAGE_SIZE_LIST], allowMultiple=False, usesStaticStrings=False, defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.COLUMNS, 'Columns per page', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=4, minValue=1))
+        self.addParameter(QgsProcessingParameterNumber(self.ROWS, 'Rows per page', type=Qgis.ProcessingNumberParameterType.Integer, defaultValue=6, minValue=1))
+        self.addParameter(QgsProcessingParameterNumber(self.MARGIN, 'Page margin (mm)', type=Qgis.ProcessingNumberParameterType.Double, defaultValue=10.0, minValue=0.0))
+        self.addParameter(QgsProcessingParameterFileDestination(self.PDF_PATH, 'PDF Output', fileFilter='PDF files (*.pdf)', defaultValue=None))
+        self.addFeatureFilterParameters()
+        self.addQrParameters()
+        self.addQrCacheParameter()
+
+    def processAlgorithm(self, parameters, context, feedback):
+        point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
+        online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        name_field = self.parameterAsString(parameters, self.NAME_FIELD, context)
+        sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
+        page_size = self.PAGE_SIZE_LIST[self.parameterAsEnum(parameters, self.PAGE_SIZE, context)][1]
+        columns = self.parameterAsInt(parameters, self.COLUMNS, context)
+        rows = self.parameterAsInt(parameters, self.ROWS, context)
+        margin = self.parameterAsDouble(parameters, self.MARGIN, context)
+        pdf_path = self.parameterAsFileOutput(parameters, self.PDF_PATH, context)
+        qr_options = self.parameterAsQrOptions(parameters, context)
+        disk_cache = self.parameterAsBool(parameters, self.QR_DISK_CACHE, context)
+
+        total = point_layer.featureCount()
+        if total == 0:
+            error_msg = 'The layer has no features. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+
+        transformer = self.createPointTransformer(point_layer.sourceCrs())
+        features = self.getSourceFeatures(parameters, context, point_layer, sort_field, [name_field])
+        link_template = self.getLinkTemplate(self.MAP_LIST[online_map])
+
+        def iterLabels():
+            for chunk, xs, ys in self.iterPointChunks(features):
+                xs, ys = transformer(xs, ys)
+                names = [feature[name_field] for feature in chunk] if name_field else [f"{x}, {y}" for x, y in zip(xs, ys)]
+                yield from zip(names, link_template.formatMany(xs, ys, names))
+
+        writer = QPdfWriter(pdf_path)
+        writer.setCreator('Online Map Linker')
+        writer.setResolution(self.RESOLUTION)
+        writer.setPageSize(QPageSize(page_size))
+        writer.setPageMargins(QMarginsF(margin, margin, margin, margin), QPageLayout.Unit.Millimeter)
+        painter = QPainter()
+        if not painter.begin(writer):
+            error_msg = f'Could not write {pdf_path}. Exiting process.'
+            feedback.reportError(error_msg)
+            raise Exception(error_msg)
+        # ページは1枚ずつPDFへ書き出され、QR画像も描画後に破棄するので、ページ数に関わらずメモリは一定
+        try:
+            font = QFont()
+            font.setPointSizeF(self.CAPTION_POINT_SIZE)
+            painter.setFont(font)
+            metrics = painter.fontMetrics()
+            # 単位はRESOLUTIONのデバイス画素。ラベルは2行分
+            cell_width = writer.width() / columns
+            cell_height = writer.height() / rows
+            caption_height = metrics.height() * 2
+            padding = min(cell_width, cell_height) * 0.05
+            qr_px = int(min(cell_width, cell_height - caption_height) - padding * 2)
+            if qr_px < 21:
+                error_msg = 'The cells are too small for QR codes. Reduce the rows or columns. Exiting process.'
+                feedback.reportError(error_msg)
+                raise Exception(error_msg)
+
+            per_page = columns * rows
+            count = 0
+            for name, link in iterLabels():
+                if feedback.isCanceled():
+                    break
+                cell = count % per_page
+                if cell == 0 and count > 0:
+                    writer.newPage()
+                row, column = divmod(cell, columns)
+                left, top = column * cell_width, row * cell_height
+                # セルの画素数に合わせて描画し、拡大縮小せずにそのまま貼る（キャッシュ済みならその画像を使う）
+                image = self.generateQrImage(link, target_px=qr_px, disk_cache=disk_cache, **qr_options)
+                side = min(image.width(), qr_px)
+                painter.drawImage(QRectF(left + (cell_width - side) / 2, top + padding, side, side), image)
+                caption_rect = QRectF(left + padding, top + padding + side, cell_width - padding * 2, caption_height)
+                caption = metrics.elidedText('' if name is None else str(name), Qt.TextElideMode.ElideRight, int(caption_rect.width() * 2))
+                painter.drawText(caption_rect, Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop | Qt.TextFlag.TextWordWrap, caption)
+                count += 1
+                feedback.setProgress(min(100, count * 100 / total))
+        finally:
+            painter.end()
+        feedback.pushInfo(f'{count} QR codes on {(count + per_page - 1) // per_page} pages.')
+        return {self.PDF_PATH: pdf_path}
+
+    def name(self):
+        return 'Online Map Linker (QR code sheet, PDF)'
+
+    def displayName(self):
+        return self.tr(self.name())
+
+    def group(self):
+        return None
+
+    def groupId(self):
+        return None
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing', string)
+
+    def createInstance(self):
+        return OnlineMapLinkerQRSheet()
 
 class QrPopupDialog(QDialog):
-    # QR画像を表示し、手動でPNG保存できるポップアップ
+    # QR画像を表示し、手動でPNG/SVG保存できるポップアップ
     DISPLAY_SIZE = 320
 
-    def __init__(self, pixmap, url, map_name, parent=None):
+    PNG_FILTER = 'PNG files (*.png)'
+    SVG_FILTER = 'SVG files (*.svg)'
+
+    def __init__(self, pixmap, url, map_name, parent=None, svg=None):
         super().__init__(parent)
         # 保存用は高解像度の原寸を保持し、表示だけ固定サイズにスケールしてウィンドウ大きさを一定にする
         self._pixmap = pixmap
+        self._svg = svg
         self._map_name = map_name
         self.setWindowTitle('Online Map Linker (QR code)')
         self.setFixedWidth(self.DISPLAY_SIZE + 40)
@@ -419,8 +1538,17 @@ class QrPopupDialog(QDialog):
 
     def saveImage(self):
         default_name = 'OML_QR(' + self._map_name + ')_' + datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime('%Y%m%d-%H%M%S') + '.png'
-        file_path, _ = QFileDialog.getSaveFileName(self, 'Save QR code', default_name, 'PNG files (*.png)')
-        if file_path:
+        filters = [self.PNG_FILTER, self.SVG_FILTER] if self._svg is not None else [self.PNG_FILTER]
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, 'Save QR code', default_name, ';;'.join(filters))
+        if not file_path:
+            return
+        # SVGはベクターなので印刷サイズに関わらずくっきりする
+        if self._svg is not None and (selected_filter == self.SVG_FILTER or file_path.lower().endswith('.svg')):
+            if not file_path.lower().endswith('.svg'):
+                file_path = os.path.splitext(file_path)[0] + '.svg'
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(self._svg)
+        else:
             self._pixmap.save(file_path, 'PNG')
 
 class OnlineMapLinkerQR(OnlineMapLinkerBase):
@@ -430,17 +1558,21 @@ class OnlineMapLinkerQR(OnlineMapLinkerBase):
     def initAlgorithm(self, config):
         self.addParameter(QgsProcessingParameterPoint(self.POINT, 'Point on map canvas', defaultValue=None))
         self.addParameter(QgsProcessingParameterEnum(self.ONLINE_MAP, 'Online Map', options=self.MAP_LIST, allowMultiple=False, usesStaticStrings=False, defaultValue='Open Street Map'))
+        self.addQrParameters()
+        self.addQrCacheParameter()
 
     def processAlgorithm(self, parameters, context, feedback):
         online_map = self.parameterAsEnum(parameters, self.ONLINE_MAP, context)
+        qr_options = self.parameterAsQrOptions(parameters, context)
+        disk_cache = self.parameterAsBool(parameters, self.QR_DISK_CACHE, context)
         wgs84_point = self.parameterAsPoint(parameters, self.POINT, context, QgsCoordinateReferenceSystem(4326))
 
-        link_function = self.generateLinkFunction(self.MAP_LIST[online_map])
-        x, y = wgs84_point.x(), wgs84_point.y()
-        url = link_function(x, y, 'Pin')
+        link_template = self.getLinkTemplate(self.MAP_LIST[online_map])
+        url = link_template.format(wgs84_point.x(), wgs84_point.y())
 
         # QImageの生成はワーカースレッドでも安全。GUI表示はpostProcessAlgorithm（メインスレッド）で行う
-        self._qr_image = self.generateQrImage(url)
+        self._qr_image = self.generateQrImage(url, disk_cache=disk_cache, **qr_options)
+        self._qr_svg = self.generateQrSvg(url, **qr_options)
         self._url = url
         self._map_name = self.MAP_LIST[online_map]
         return {}
@@ -449,7 +1581,7 @@ class OnlineMapLinkerQR(OnlineMapLinkerBase):
         from qgis.utils import iface
         parent = iface.mainWindow() if iface else None
         pixmap = QPixmap.fromImage(self._qr_image)
-        dialog = QrPopupDialog(pixmap, self._url, self._map_name, parent)
+        dialog = QrPopupDialog(pixmap, self._url, self._map_name, parent, svg=self._qr_svg)
         # モードレス表示にしてプロセッシングを完了させ、QGIS本体を操作可能にする
         dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
         _open_qr_dialogs.append(dialog)
@@ -481,56 +1613,44 @@ class OnlineMapLinkerMultiQR(OnlineMapLinkerBase):
     CURRENT_LOCATION = 'current_location'
 
     def initAlgorithm(self, config):
-        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links (Up to 10 features, or 9 if starting from current location.)', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.POINT_LAYER, 'Point Layer for creating links (Up to 10 features, or 9 if starting from current location, unless the route is split.)', types=[QgsProcessing.SourceType.TypeVectorPoint], defaultValue=None))
         self.addParameter(QgsProcessingParameterBoolean(self.CURRENT_LOCATION, 'Start from current location (the device that opens the link)', defaultValue=True))
         self.addParameter(QgsProcessingParameterField(self.SORT_FIELD, 'Sort Field', parentLayerParameterName=self.POINT_LAYER, allowMultiple=False, defaultValue=None, optional=True))
+        self.addRoutingParameters()
+        self.addFeatureFilterParameters()
+        self.addQrParameters()
+        self.addQrCacheParameter()
 
     def processAlgorithm(self, parameters, context, feedback):
         point_layer = self.parameterAsSource(parameters, self.POINT_LAYER, context)
         sort_field = self.parameterAsString(parameters, self.SORT_FIELD, context)
         current_location = self.parameterAsBool(parameters, self.CURRENT_LOCATION, context)
+        qr_options = self.parameterAsQrOptions(parameters, context)
+        disk_cache = self.parameterAsBool(parameters, self.QR_DISK_CACHE, context)
 
-        # Google Mapsの経路は合計10地点まで。現在地スタート時は現在地が1地点を消費するためレイヤは9点まで
-        max_points = 9 if current_location else 10
-        feature_count = point_layer.featureCount()
-        if feature_count == 0:
-            error_msg = 'The layer has no features. Exiting process.'
-            feedback.reportError(error_msg)
-            raise Exception(error_msg)
-        elif feature_count > max_points:
-            error_msg = f'The layer has over {max_points} features. Exiting process.'
-            feedback.reportError(error_msg)
-            raise Exception(error_msg)
-
-        transform = self.createCoordinateTransform(point_layer.sourceCrs())
-        features = self.getSortedFeatures(point_layer, sort_field)
-
-        URL = 'https://www.google.co.jp/maps/dir'
-        if current_location:
-            # 出発地を空にすると現在地が始点になる（.../dir//lat,lon/...）
-            URL += '/'
-        for feature in features:
-            geometry = feature.geometry()
-            geometry.transform(transform)
-            x, y = geometry.asPoint().x(), geometry.asPoint().y()
-            URL += f"/{y},{x}"
+        urls = self.getRouteUrls(parameters, context, feedback, point_layer, sort_field, current_location)
+        if feedback.isCanceled():
+            return {}
 
         # QImageの生成はワーカースレッドでも安全。GUI表示はpostProcessAlgorithm（メインスレッド）で行う
-        self._qr_image = self.generateQrImage(URL)
-        self._url = URL
-        self._map_name = 'Google Maps (Multi-destination routing)'
+        # 区間ごとに1つずつQRコードを作る
+        map_name = 'Google Maps (Multi-destination routing)'
+        self._qr_codes = []
+        for n, url in enumerate(urls, 1):
+            title = map_name if len(urls) == 1 else f'{map_name} ({n}/{len(urls)})'
+            self._qr_codes.append((self.generateQrImage(url, disk_cache=disk_cache, **qr_options), self.generateQrSvg(url, **qr_options), url, title))
         return {}
 
     def postProcessAlgorithm(self, context, feedback):
         from qgis.utils import iface
         parent = iface.mainWindow() if iface else None
-        pixmap = QPixmap.fromImage(self._qr_image)
-        dialog = QrPopupDialog(pixmap, self._url, self._map_name, parent)
-        # モードレス表示にしてプロセッシングを完了させ、QGIS本体を操作可能にする
-        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
-        _open_qr_dialogs.append(dialog)
-        dialog.finished.connect(lambda _result, d=dialog: _open_qr_dialogs.remove(d))
-        dialog.show()
+        for image, svg, url, title in self._qr_codes:
+            dialog = QrPopupDialog(QPixmap.fromImage(image), url, title, parent, svg=svg)
+            # モードレス表示にしてプロセッシングを完了させ、QGIS本体を操作可能にする
+            dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+            _open_qr_dialogs.append(dialog)
+            dialog.finished.connect(lambda _result, d=dialog: _open_qr_dialogs.remove(d))
+            dialog.show()
         return {}
 
     def name(self):
@@ -11,7 +11,7 @@ __revision__ = '$Format:%H$'
 from pathlib import Path
 from qgis.PyQt.QtGui import QIcon
 from qgis.core import QgsProcessingProvider
-from .online_map_linker_algorithm import OnlineMapLinkerHTML,OnlineMapLinkerCSV,OnlineMapLinkerLayer, OnlineMapLinkerMulti, OnlineMapLinkerQR, OnlineMapLinkerMultiQR
+from .online_map_linker_algorithm import OnlineMapLinkerHTML,OnlineMapLinkerCSV,OnlineMapLinkerNDJSON,OnlineMapLinkerLayer, OnlineMapLinkerMulti, OnlineMapLinkerClusterRoutes, OnlineMapLinkerQR, OnlineMapLinkerMultiQR, OnlineMapLinkerBatchQR, OnlineMapLinkerQRSheet
 
 
 class OnlineMapLinkerProvider(QgsProcessingProvider):
@@ -25,10 +25,14 @@ class OnlineMapLinkerProvider(QgsProcessingProvider):
     def loadAlgorithms(self):
         self.addAlgorithm(OnlineMapLinkerHTML())
         self.addAlgorithm(OnlineMapLinkerCSV())
+        self.addAlgorithm(OnlineMapLinkerNDJSON())
         self.addAlgorithm(OnlineMapLinkerLayer())
         self.addAlgorithm(OnlineMapLinkerMulti())
+        self.addAlgorithm(OnlineMapLinkerClusterRoutes())
         self.addAlgorithm(OnlineMapLinkerQR())
         self.addAlgorithm(OnlineMapLinkerMultiQR())
+        self.addAlgorithm(OnlineMapLinkerBatchQR())
+        self.addAlgorithm(OnlineMapLinkerQRSheet())
         # add additional algorithms here
 
     def id(self):
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Sanda Takeru'
+__date__ = '2024-07-17'
+__copyright__ = '(C) 2024 by Sanda Takeru'
+__revision__ = '$Format:%H$'
+
+# QRコードのエンコードとPNG/SVG化。QGIS/Qtに依存しないので、プロセスプールのワーカーからも読み込める
+
+import struct, zlib, hashlib, json, os, re, tempfile, threading, collections
+
+from .qrcodegen import QrCode, QrSegment
+
+# pickleで渡されたEccは別インスタンスになるため、序数から定数に戻してキャッシュを効かせる
+_ECC_LEVELS = (QrCode.Ecc.LOW, QrCode.Ecc.MEDIUM, QrCode.Ecc.QUARTILE, QrCode.Ecc.HIGH)
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# get_bitmapは暗=1、PNGの1ビットグレースケールは0=黒なので全ビットを反転する
+_INVERT_BITS = bytes(255 - i for i in range(256))
+
+def encodeQr(text, ecl=QrCode.Ecc.MEDIUM, boostecl=True, mask=-1, maskcandidates=None, penaltythreshold=None):
+    # 数字・英数字・バイトモードを混在させた最短の分割でエンコードし、バージョン(=モジュール数)を抑える
+    # マスクを固定(0-7)するとマトリクスの8回評価を省ける
+    ecl = _ECC_LEVELS[ecl.ordinal]
+    segs = QrSegment.make_segments_optimally(text, ecl)
+    return QrCode.encode_segments(segs, ecl, mask=mask, boostecl=boostecl, maskcandidates=maskcandidates, penaltythreshold=penaltythreshold)
+
+def qrScale(qr, target_px=720, border=4):
+    # 情報量(モジュール数)に関わらず原寸をほぼ一定にし、モジュールは整数px(=くっきり)にする
+    return max(1, target_px // (qr.get_size() + border * 2))
+
+def _pngChunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def encodePng(bitmap, width, height, level=6):
+    # 1ビットグレースケールのPNG。bitmapはMSB先頭・行は1バイト境界・暗=1
+    stride = (width + 7) // 8
+    pixels = bitmap.translate(_INVERT_BITS)
+    # 各行の先頭にフィルタ種別0(なし)を付ける
+    rows = b''.join(b'\x00' + pixels[i:i + stride] for i in range(0, stride * height, stride))
+    header = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+    return _PNG_SIGNATURE + _pngChunk(b'IHDR', header) + _pngChunk(b'IDAT', zlib.compress(rows, level)) + _pngChunk(b'IEND', b'')
+
+def renderQrPng(qr, target_px=720, border=4):
+    scale = qrScale(qr, target_px, border)
+    img_size = (qr.get_size() + border * 2) * scale
+    return encodePng(qr.get_bitmap(border, scale), img_size, img_size)
+
+_DARK_RUNS = re.compile('1+')
+
+def renderQrSvg(qr, target_px=720, border=4):
+    # 1モジュール=1単位のSVG。各行の暗モジュールの連続区間を1つの矩形にまとめ、全体を1本のpathで描く
+    size = qr.get_size()
+    stride = (size + 7) // 8
+    bitmap = qr.get_bitmap()
+    path = []
+    for y in range(size):
+        bits = format(int.from_bytes(bitmap[y * stride:(y + 1) * stride], 'big'), f'0{stride * 8}b')
+        path.extend(f'M{run.start() + border},{y + border}h{run.end() - run.start()}v1h-{run.end() - run.start()}z' for run in _DARK_RUNS.finditer(bits, 0, size))
+    dimension = size + border * 2
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="{target_px}" height="{target_px}" viewBox="0 0 {dimension} {dimension}" shape-rendering="crispEdges">\n'
+            '<rect width="100%" height="100%" fill="#FFFFFF"/>\n'
+            f'<path d="{"".join(path)}" fill="#000000"/>\n'
+            '</svg>\n')
+
+# 一括出力の画像形式: 拡張子 -> 描画関数(バイト列を返す)
+IMAGE_RENDERERS = {
+    'png': renderQrPng,
+    'svg': lambda qr, target_px=720, border=4: renderQrSvg(qr, target_px, border).encode('utf-8'),
+}
+
+def renderQrBatch(task):
+    # プロセスプールのワーカーで実行する。引数・戻り値はpickleできる値だけにする
+    # task: (エンコード設定, [(ファイル名, テキスト), ...]) -> [(ファイル名, 画像のバイト列), ...]
+    options, jobs = task
+    options = dict(options)
+    target_px = options.pop('target_px', 720)
+    border = options.pop('border', 4)
+    render = IMAGE_RENDERERS[options.pop('image_format', 'png')]
+    return [(name, render(encodeQr(text, **options), target_px, border)) for name, text in jobs]
+
+class QrCache:
+    # 内容アドレス方式のキャッシュ。キーはテキストと符号化・描画設定のSHA-256
+    # メモリには符号化済みのQrCodeをLRUで、ディスクには描画済みPNGを容量上限付きで保持する
+    def __init__(self, directory=None, max_disk_bytes=64 << 20, max_entries=256):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_entries = max_entries
+        self._codes = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # ディスク上の合計サイズ。最初の書き込み時にフォルダを走査して求める
+        self._disk_bytes = None
+
+    @staticmethod
+    def cacheKey(text, **settings):
+        settings = {name: value.ordinal if isinstance(value, QrCode.Ecc) else value for name, value in settings.items()}
+        return hashlib.sha256(json.dumps([text, settings], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def encode(self, text, ecl=QrCode.Ecc.MEDIUM, boostecl=True, mask=-1, maskcandidates=None, penaltythreshold=None):
+        key = self.cacheKey(text, ecl=ecl, boostecl=boostecl, mask=mask, maskcandidates=maskcandidates, penaltythreshold=penaltythreshold)
+        with self._lock:
+            qr = self._codes.get(key)
+            if qr is not None:
+                self._codes.move_to_end(key)
+                return qr
+        qr = encodeQr(text, ecl, boostecl, mask, maskcandidates, penaltythreshold)
+        with self._lock:
+            self._codes[key] = qr
+            while len(self._codes) > self.max_entries:
+                self._codes.popitem(last=False)
+        return qr
+
+    def renderPng(self, text, target_px=720, border=4, ecl=QrCode.Ecc.MEDIUM, boostecl=True, mask=-1, maskcandidates=None, penaltythreshold=None, use_disk=True):
+        use_disk = use_disk and bool(self.directory)
+        if use_disk:
+            key = self.cacheKey(text, target_px=target_px, border=border, ecl=ecl, boostecl=boostecl, mask=mask, maskcandidates=maskcandidates, penaltythreshold=penaltythreshold)
+            data = self.loadPng(key)
+            if data is not None:
+                return data
+        data = renderQrPng(self.encode(text, ecl, boostecl, mask, maskcandidates, penaltythreshold), target_px, border)
+        if use_disk:
+            self.storePng(key, data)
+        return data
+
+    def loadPng(self, key):
+        path = os.path.join(self.directory, key + '.png')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # 最終利用時刻を更新し、削除を使われていない順にする
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def storePng(self, key, data):
+        # キャッシュに書けなくても生成結果には影響しないので、書き込みの失敗は無視する
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # 別スレッド・別のQGISから同じキーを読んでも壊れたファイルが見えないよう、一時ファイルから置き換える
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as f:
+                f.write(data)
+            os.replace(f.name, os.path.join(self.directory, key + '.png'))
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _mtime, size, _path in self._scanDisk())
+            else:
+                self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _scanDisk(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.png'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:  # 他のQGISが削除した
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self):
+        # 上限を超えたら、使われていない順に上限の3/4まで削除する（削除のたびに走査しないよう余裕を残す）
+        entries = sorted(self._scanDisk())
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in entries:
+            if total <= self.max_disk_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
@@ -22,7 +22,7 @@
 # 
 
 from __future__ import annotations
-import collections, itertools, re
+import bisect, collections, functools, itertools, re
 from collections.abc import Sequence
 from typing import Optional, Union
 
@@ -70,13 +70,16 @@ class QrCode:
 	# ---- Static factory functions (mid level) ----
 	
 	@staticmethod
-	def encode_segments(segs: Sequence[QrSegment], ecl: QrCode.Ecc, minversion: int = 1, maxversion: int = 40, mask: int = -1, boostecl: bool = True) -> QrCode:
+	def encode_segments(segs: Sequence[QrSegment], ecl: QrCode.Ecc, minversion: int = 1, maxversion: int = 40, mask: int = -1, boostecl: bool = True,
+			maskcandidates: Optional[Sequence[int]] = None, penaltythreshold: Optional[float] = None) -> QrCode:
 		"""Returns a QR Code representing the given segments with the given encoding parameters.
 		The smallest possible QR Code version within the given range is automatically
 		chosen for the output. Iff boostecl is true, then the ECC level of the result
 		may be higher than the ecl argument if it can be done without increasing the
 		version. The mask number is either between 0 to 7 (inclusive) to force that
 		mask, or -1 to automatically choose an appropriate mask (which may be slow).
+		When choosing automatically, maskcandidates and penaltythreshold can narrow
+		the search; see the constructor for details.
 		This function allows the user to create a custom sequence of segments that switches
 		between modes (such as alphanumeric and byte) to encode text in less space.
 		This is a mid-level API; the high-level API is encode_text() and encode_binary()."""
@@ -84,18 +87,26 @@ class QrCode:
 		if not (QrCode.MIN_VERSION <= minversion <= maxversion <= QrCode.MAX_VERSION) or not (-1 <= mask <= 7):
 			raise ValueError("Invalid value")
 		
-		# Find the minimal version number to use
-		for version in range(minversion, maxversion + 1):
-			datacapacitybits: int = QrCode._get_num_data_codewords(version, ecl) * 8  # Number of data bits available
-			datausedbits: Optional[int] = QrSegment.get_total_bits(segs, version)
-			if (datausedbits is not None) and (datausedbits <= datacapacitybits):
+		# Find the minimal version number to use. The segments' bit length only changes between the
+		# version ranges that share character count field widths, so it is computed once per range
+		# and the version is looked up in the ascending table of data capacities.
+		capacities: Sequence[int] = QrCode._get_data_capacity_bits(ecl)  # Number of data bits available, by version
+		for (low, high) in QrCode._CHAR_COUNT_VERSION_RANGES:
+			low, high = max(low, minversion), min(high, maxversion)
+			if low > high:
+				continue
+			datausedbits: Optional[int] = QrSegment.get_total_bits(segs, low)
+			if datausedbits is None:
+				continue
+			version: int = bisect.bisect_left(capacities, datausedbits, low, high + 1)
+			if version <= high:
 				break  # This version number is found to be suitable
-			if version >= maxversion:  # All versions in the range could not fit the given data
-				msg: str = "Segment too long"
-				if datausedbits is not None:
-					msg = f"Data length = {datausedbits} bits, Max capacity = {datacapacitybits} bits"
-				raise DataTooLongError(msg)
-		assert datausedbits is not None
+		else:  # All versions in the range could not fit the given data
+			datausedbits = QrSegment.get_total_bits(segs, maxversion)
+			msg: str = "Segment too long"
+			if datausedbits is not None:
+				msg = f"Data length = {datausedbits} bits, Max capacity = {capacities[maxversion]} bits"
+			raise DataTooLongError(msg)
 		
 		# Increase the error correction level while the data still fits in the current version number
 		for newecl in (QrCode.Ecc.MEDIUM, QrCode.Ecc.QUARTILE, QrCode.Ecc.HIGH):  # From low to high
@@ -107,7 +118,7 @@ class QrCode:
 		for seg in segs:
 			bb.append_bits(seg.get_mode().get_mode_bits(), 4)
 			bb.append_bits(seg.get_num_chars(), seg.get_mode().num_char_count_bits(version))
-			bb.extend(seg._bitdata)
+			bb.append_buffer(seg._bitdata)
 		assert len(bb) == datausedbits
 		
 		# Add terminator and pad up to a byte if applicable
@@ -118,18 +129,14 @@ class QrCode:
 		assert len(bb) % 8 == 0
 		
 		# Pad with alternating bytes until data capacity is reached
-		for padbyte in itertools.cycle((0xEC, 0x11)):
-			if len(bb) >= datacapacitybits:
-				break
-			bb.append_bits(padbyte, 8)
+		numpadbytes: int = max(datacapacitybits - len(bb), 0) // 8
+		bb.append_bytes(bytes(itertools.islice(itertools.cycle((0xEC, 0x11)), numpadbytes)))
 		
-		# Pack bits into bytes in big endian
-		datacodewords = bytearray([0] * (len(bb) // 8))
-		for (i, bit) in enumerate(bb):
-			datacodewords[i >> 3] |= bit << (7 - (i & 7))
+		# The bits are already packed in big endian
+		datacodewords: bytes = bb.to_bytes()
 		
 		# Create the QR Code object
-		return QrCode(version, ecl, datacodewords, mask)
+		return QrCode(version, ecl, datacodewords, mask, maskcandidates, penaltythreshold)
 	
 	
 	# ---- Private fields ----
@@ -150,19 +157,25 @@ class QrCode:
 	# the resulting object still has a mask value between 0 and 7.
 	_mask: int
 	
-	# The modules of this QR Code (False = light, True = dark).
-	# Immutable after constructor finishes. Accessed through get_module().
-	_modules: list[list[bool]]
+	# The modules of this QR Code, packed one integer per row: bit x of _modules[y] is the
+	# module at (x, y) (0 = light, 1 = dark). Immutable after constructor finishes.
+	# Accessed through get_module().
+	_modules: list[int]
 	
-	# Indicates function modules that are not subjected to masking. Discarded when constructor finishes.
-	_isfunction: list[list[bool]]
+	# Indicates function modules that are not subjected to masking, packed like _modules.
+	# Discarded when constructor finishes.
+	_isfunction: list[int]
 	
 	
 	# ---- Constructor (low level) ----
 	
-	def __init__(self, version: int, errcorlvl: QrCode.Ecc, datacodewords: Union[bytes,Sequence[int]], msk: int) -> None:
+	def __init__(self, version: int, errcorlvl: QrCode.Ecc, datacodewords: Union[bytes,Sequence[int]], msk: int,
+			maskcandidates: Optional[Sequence[int]] = None, penaltythreshold: Optional[float] = None) -> None:
 		"""Creates a new QR Code with the given version number,
 		error correction level, data codeword bytes, and mask number.
+		If msk is -1, the masks in maskcandidates (default all 8) are scored in the
+		given order and the lowest penalty wins; if penaltythreshold is given, the
+		search stops at the first mask whose penalty per module is at most that value.
 		This is a low-level API that most users should not use directly.
 		A mid-level API is the encode_segments() function."""
 		
@@ -171,24 +184,29 @@ class QrCode:
 			raise ValueError("Version value out of range")
 		if not (-1 <= msk <= 7):
 			raise ValueError("Mask value out of range")
+		if maskcandidates is None:
+			maskcandidates = range(8)
+		elif len(maskcandidates) == 0 or not all(0 <= i <= 7 for i in maskcandidates):
+			raise ValueError("Mask candidate out of range")
 		
 		self._version = version
 		self._size = version * 4 + 17
 		self._errcorlvl = errcorlvl
 		
-		# Initialize both grids to be size*size arrays of Boolean false
-		self._modules    = [[False] * self._size for _ in range(self._size)]  # Initially all light
-		self._isfunction = [[False] * self._size for _ in range(self._size)]
+		# Start from a copy of the function patterns of this version, which are drawn once per version
+		template: QrCode._VersionTemplate = QrCode._get_version_template(version)
+		self._modules    = list(template.modules)
+		self._isfunction = list(template.isfunction)
 		
 		# Compute ECC, draw modules
-		self._draw_function_patterns()
 		allcodewords: bytes = self._add_ecc_and_interleave(bytearray(datacodewords))
 		self._draw_codewords(allcodewords)
 		
 		# Do masking
 		if msk == -1:  # Automatically choose best mask
 			minpenalty: int = 1 << 32
-			for i in range(8):
+			maxpenalty: float = -1 if penaltythreshold is None else penaltythreshold * self._size**2
+			for i in maskcandidates:
 				self._apply_mask(i)
 				self._draw_format_bits(i)
 				penalty = self._get_penalty_score()
@@ -196,6 +214,8 @@ class QrCode:
 					msk = i
 					minpenalty = penalty
 				self._apply_mask(i)  # Undoes the mask due to XOR
+				if minpenalty <= maxpenalty:
+					break  # Good enough; skip the remaining candidates
 		assert 0 <= msk <= 7
 		self._mask = msk
 		self._apply_mask(msk)  # Apply the final choice of mask
@@ -226,7 +246,28 @@ class QrCode:
 		"""Returns the color of the module (pixel) at the given coordinates, which is False
 		for light or True for dark. The top left corner has the coordinates (x=0, y=0).
 		If the given coordinates are out of bounds, then False (light) is returned."""
-		return (0 <= x < self._size) and (0 <= y < self._size) and self._modules[y][x]
+		return (0 <= x < self._size) and (0 <= y < self._size) and ((self._modules[y] >> x) & 1 != 0)
+	
+	def get_bitmap(self, border: int = 0, scale: int = 1, rowalign: int = 1) -> bytes:
+		"""Returns all modules of this QR Code at once as a packed bitmap of 1 bit per pixel, top row first.
+		Each module becomes scale*scale pixels, and a quiet zone of border light modules is added on
+		every side, so the bitmap is (get_size() + border * 2) * scale pixels wide and high. In each row
+		the leftmost pixel is the most significant bit of the first byte, dark pixels are 1, and the
+		row is padded with light pixels to a whole multiple of rowalign bytes."""
+		if (border < 0) or (scale < 1) or (rowalign < 1):
+			raise ValueError("Value out of range")
+		width: int = (self._size + border * 2) * scale
+		stride: int = (width + rowalign * 8 - 1) // (rowalign * 8) * rowalign  # Bytes per row
+		margin: str = "0" * (border * scale)
+		tail: str = margin + "0" * (stride * 8 - width)
+		expand: dict[int,str] = {ord("0"): "0" * scale, ord("1"): "1" * scale}
+		quietrows: bytes = bytes(stride) * (border * scale)
+		parts: list[bytes] = [quietrows]
+		for row in self._modules:
+			bits: str = margin + format(row, f"0{self._size}b")[::-1].translate(expand) + tail
+			parts.append(int(bits, 2).to_bytes(stride, "big") * scale)  # Replicate the scanline, not the pixels
+		parts.append(quietrows)
+		return b"".join(parts)
 	
 	
 	# ---- Private helper methods for constructor: Drawing function modules ----
@@ -330,8 +371,12 @@ class QrCode:
 		"""Sets the color of a module and marks it as a function module.
 		Only used by the constructor. Coordinates must be in bounds."""
 		assert type(isdark) is bool
-		self._modules[y][x] = isdark
-		self._isfunction[y][x] = True
+		bit: int = 1 << x
+		if isdark:
+			self._modules[y] |= bit
+		else:
+			self._modules[y] &= ~bit
+		self._isfunction[y] |= bit
 	
 	
 	# ---- Private helper methods for constructor: Codewords and masking ----
@@ -375,25 +420,61 @@ class QrCode:
 	
 	def _draw_codewords(self, data: bytes) -> None:
 		"""Draws the given sequence of 8-bit codewords (data and error correction) onto the entire
-		data area of this QR Code. Function modules need to be marked off before this is called."""
+		data area of this QR Code. Function modules need to be marked off before this is called.
+		The module of every data bit is looked up in the cached placement table of this version."""
 		assert len(data) == QrCode._get_num_raw_data_modules(self._version) // 8
+		placement: Sequence[tuple[int,int]] = QrCode._get_version_template(self._version).placement
+		numbits: int = len(data) * 8
+		assert numbits <= len(placement)
+		
+		# One selector byte (0 or 1) per data bit, most significant bit of each codeword first
+		bits: bytes = format(int.from_bytes(data, "big"), f"0{numbits}b").encode("ascii").translate(_BIT_SELECTORS)
+		modules: list[int] = self._modules
+		for (y, xbit) in itertools.compress(placement, bits):
+			modules[y] |= xbit
+		# If this QR Code has any remainder bits (0 to 7), they were assigned as
+		# 0/false/light by the template and are left unchanged by this method
+	
+	
+	class _VersionTemplate:
+		"""The parts of a QR Code that depend only on its version number. Immutable."""
+		modules: tuple[int,...]  # Function modules drawn (format bits are placeholders), packed like QrCode._modules
+		isfunction: tuple[int,...]  # Function module flags, packed like QrCode._isfunction
+		placement: tuple[tuple[int,int],...]  # (y, 1 << x) of each data module, in zigzag scan order
+		
+		def __init__(self, modules: Sequence[int], isfunction: Sequence[int], placement: Sequence[tuple[int,int]]) -> None:
+			self.modules = tuple(modules)
+			self.isfunction = tuple(isfunction)
+			self.placement = tuple(placement)
+	
+	
+	@staticmethod
+	@functools.lru_cache(maxsize=8)
+	def _get_version_template(version: int) -> QrCode._VersionTemplate:
+		"""Returns the function patterns and the codeword placement order for the given version number,
+		computed on first use. The number of cached versions is bounded."""
+		qr: QrCode = QrCode.__new__(QrCode)  # Bare object, only used to draw the function patterns
+		qr._version = version
+		qr._size = size = version * 4 + 17
+		qr._errcorlvl = QrCode.Ecc.LOW  # Format bits are redrawn after masking anyway
+		qr._modules = [0] * size
+		qr._isfunction = [0] * size
+		qr._draw_function_patterns()
 		
-		i: int = 0  # Bit index into the data
+		placement: list[tuple[int,int]] = []
 		# Do the funny zigzag scan
-		for right in range(self._size - 1, 0, -2):  # Index of right column in each column pair
+		for right in range(size - 1, 0, -2):  # Index of right column in each column pair
 			if right <= 6:
 				right -= 1
-			for vert in range(self._size):  # Vertical counter
+			upward: bool = (right + 1) & 2 == 0
+			for vert in range(size):  # Vertical counter
+				y: int = (size - 1 - vert) if upward else vert  # Actual y coordinate
 				for j in range(2):
 					x: int = right - j  # Actual x coordinate
-					upward: bool = (right + 1) & 2 == 0
-					y: int = (self._size - 1 - vert) if upward else vert  # Actual y coordinate
-					if (not self._isfunction[y][x]) and (i < len(data) * 8):
-						self._modules[y][x] = _get_bit(data[i >> 3], 7 - (i & 7))
-						i += 1
-					# If this QR Code has any remainder bits (0 to 7), they were assigned as
-					# 0/false/light by the constructor and are left unchanged by this method
-		assert i == len(data) * 8
+					if not _get_bit(qr._isfunction[y], x):
+						placement.append((y, 1 << x))
+		assert len(placement) == QrCode._get_num_raw_data_modules(version)
+		return QrCode._VersionTemplate(qr._modules, qr._isfunction, placement)
 	
 	
 	def _apply_mask(self, mask: int) -> None:
@@ -404,66 +485,35 @@ class QrCode:
 		QR Code needs exactly one (not zero, two, etc.) mask applied."""
 		if not (0 <= mask <= 7):
 			raise ValueError("Mask value out of range")
-		masker: collections.abc.Callable[[int,int],int] = QrCode._MASK_PATTERNS[mask]
-		for y in range(self._size):
-			for x in range(self._size):
-				self._modules[y][x] ^= (masker(x, y) == 0) and (not self._isfunction[y][x])
+		maskrows: tuple[int,...] = QrCode._get_mask_rows(self._size, mask)
+		modules: list[int] = self._modules
+		for (y, (maskrow, funcrow)) in enumerate(zip(maskrows, self._isfunction)):
+			modules[y] ^= maskrow & ~funcrow
 	
 	
 	def _get_penalty_score(self) -> int:
 		"""Calculates and returns the penalty score based on state of this QR Code's current modules.
-		This is used by the automatic mask choice algorithm to find the mask pattern that yields the lowest score."""
+		This is used by the automatic mask choice algorithm to find the mask pattern that yields the lowest score.
+		Rows are evaluated directly on the packed bits, and columns on a transposed copy of them."""
 		result: int = 0
 		size: int = self._size
-		modules: list[list[bool]] = self._modules
-		
-		# Adjacent modules in row having same color, and finder-like patterns
-		for y in range(size):
-			runcolor: bool = False
-			runx: int = 0
-			runhistory = collections.deque([0] * 7, 7)
-			for x in range(size):
-				if modules[y][x] == runcolor:
-					runx += 1
-					if runx == 5:
-						result += QrCode._PENALTY_N1
-					elif runx > 5:
-						result += 1
-				else:
-					self._finder_penalty_add_history(runx, runhistory)
-					if not runcolor:
-						result += self._finder_penalty_count_patterns(runhistory) * QrCode._PENALTY_N3
-					runcolor = modules[y][x]
-					runx = 1
-			result += self._finder_penalty_terminate_and_count(runcolor, runx, runhistory) * QrCode._PENALTY_N3
-		# Adjacent modules in column having same color, and finder-like patterns
-		for x in range(size):
-			runcolor = False
-			runy: int = 0
-			runhistory = collections.deque([0] * 7, 7)
-			for y in range(size):
-				if modules[y][x] == runcolor:
-					runy += 1
-					if runy == 5:
-						result += QrCode._PENALTY_N1
-					elif runy > 5:
-						result += 1
-				else:
-					self._finder_penalty_add_history(runy, runhistory)
-					if not runcolor:
-						result += self._finder_penalty_count_patterns(runhistory) * QrCode._PENALTY_N3
-					runcolor = modules[y][x]
-					runy = 1
-			result += self._finder_penalty_terminate_and_count(runcolor, runy, runhistory) * QrCode._PENALTY_N3
+		full: int = (1 << size) - 1
+		rows: list[int] = self._modules
+		cols: list[int] = _transpose(rows, size)
+		
+		# Adjacent modules in row/column having same color, and finder-like patterns
+		for line in itertools.chain(rows, cols):
+			result += QrCode._run_penalty(line) + QrCode._run_penalty(~line & full)
+			result += QrCode._finder_penalty_count(line, size) * QrCode._PENALTY_N3
 		
 		# 2*2 blocks of modules having same color
-		for y in range(size - 1):
-			for x in range(size - 1):
-				if modules[y][x] == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
-					result += QrCode._PENALTY_N2
+		for (upper, lower) in zip(rows, rows[1:]):
+			dark: int = upper & lower
+			light: int = ~(upper | lower) & full
+			result += _popcount((dark & (dark >> 1)) | (light & (light >> 1))) * QrCode._PENALTY_N2
 		
 		# Balance of dark and light modules
-		dark: int = sum((1 if cell else 0) for row in modules for cell in row)
+		dark = sum(_popcount(row) for row in rows)
 		total: int = size**2  # Note that size is odd, so dark/total != 1/2
 		# Compute the smallest integer k >= 0 such that (45-5k)% <= dark/total <= (55+5k)%
 		k: int = (abs(dark * 20 - total * 10) + total - 1) // total - 1
@@ -473,6 +523,40 @@ class QrCode:
 		return result
 	
 	
+	@staticmethod
+	def _run_penalty(bits: int) -> int:
+		"""Returns the N1 penalty for the runs of set bits in the given line: each run of
+		length 5 + i scores PENALTY_N1 + i. A helper function for _get_penalty_score()."""
+		windows: int = bits & (bits >> 1) & (bits >> 2) & (bits >> 3) & (bits >> 4)  # Starts of 5 set bits in a row
+		starts: int = windows & ~(windows << 1)  # One bit per run of 5 or more
+		return _popcount(windows) + _popcount(starts) * (QrCode._PENALTY_N1 - 1)
+	
+	
+	@staticmethod
+	def _finder_penalty_count(line: int, size: int) -> int:
+		"""Returns the number of finder-like patterns (dark:light:dark:light:dark runs in the ratio
+		1:1:3:1:1, with light runs of at least 4 units on one side and 1 unit on the other) in the
+		given line of modules, where the area outside the line counts as light. A pattern that
+		qualifies on both sides counts twice. A helper function for _get_penalty_score()."""
+		padded: int = line << size  # Light border of size modules on both sides
+		light: int = ~padded & ((1 << (size * 3)) - 1)
+		result: int = 0
+		for n in range(1, size // 7 + 1):
+			dark3: int = _runs_of_ones(padded, n * 3)
+			if dark3 == 0:
+				break  # No dark run is long enough for this or any larger pattern
+			# Dark runs of exactly n and 3n modules, and light runs of at least n and 4n modules, by start position
+			exact1: int = _runs_of_ones(padded, n) & (light << 1) & (light >> n)
+			exact3: int = dark3 & (light << 1) & (light >> (n * 3))
+			light1: int = _runs_of_ones(light, n)
+			light4: int = _runs_of_ones(light, n * 4)
+			core: int = exact1 & (light1 >> n) & (exact3 >> (n * 2)) & (light1 >> (n * 5)) & (exact1 >> (n * 6))
+			if core != 0:
+				result += _popcount(core & (light1 << n) & (light4 >> (n * 7)))
+				result += _popcount(core & (light4 << (n * 4)) & (light1 >> (n * 7)))
+		return result
+	
+	
 	# ---- Private helper functions ----
 	
 	def _get_alignment_pattern_positions(self) -> list[int]:
@@ -488,6 +572,15 @@ class QrCode:
 			return list(reversed(result))
 	
 	
+	@staticmethod
+	@functools.lru_cache(maxsize=64)
+	def _get_mask_rows(size: int, mask: int) -> tuple[int,...]:
+		"""Returns the given mask pattern for a QR Code of the given size, packed one integer per row
+		with a bit set where the mask inverts the module. Cached per size and mask."""
+		masker: collections.abc.Callable[[int,int],int] = QrCode._MASK_PATTERNS[mask]
+		return tuple(sum((1 << x) for x in range(size) if masker(x, y) == 0) for y in range(size))
+	
+	
 	@staticmethod
 	def _get_num_raw_data_modules(ver: int) -> int:
 		"""Returns the number of data bits that can be stored in a QR Code of the given version number, after
@@ -516,9 +609,19 @@ class QrCode:
 	
 	
 	@staticmethod
+	@functools.lru_cache(maxsize=None)
+	def _get_data_capacity_bits(ecl: QrCode.Ecc) -> tuple[int,...]:
+		"""Returns the number of data bits of every version at the given error correction level,
+		indexed by version number (index 0 is for padding, and is set to an illegal value)."""
+		return (-1,) + tuple((QrCode._get_num_data_codewords(ver, ecl) * 8)
+			for ver in range(QrCode.MIN_VERSION, QrCode.MAX_VERSION + 1))
+	
+	
+	@staticmethod
+	@functools.lru_cache(maxsize=None)
 	def _reed_solomon_compute_divisor(degree: int) -> bytes:
-		"""Returns a Reed-Solomon ECC generator polynomial for the given degree. This could be
-		implemented as a lookup table over all possible parameter values, instead of as an algorithm."""
+		"""Returns a Reed-Solomon ECC generator polynomial for the given degree. Results are
+		cached per degree, so each generator polynomial is only computed once per process."""
 		if not (1 <= degree <= 255):
 			raise ValueError("Degree out of range")
 		# Polynomial coefficients are stored from highest to lowest power, excluding the leading term which is always 1.
@@ -536,60 +639,47 @@ class QrCode:
 				if j + 1 < degree:
 					result[j] ^= result[j + 1]
 			root = QrCode._reed_solomon_multiply(root, 0x02)
-		return result
+		return bytes(result)
+	
+	
+	@staticmethod
+	@functools.lru_cache(maxsize=64)
+	def _reed_solomon_divisor_multiples(divisor: bytes) -> tuple[int,...]:
+		"""Returns, for every factor 0 to 255, the product of the given divisor polynomial and the
+		factor, packed big endian into a single integer of len(divisor) bytes. A helper for
+		_reed_solomon_compute_remainder(), cached per divisor."""
+		logs: list[int] = [_GF_LOG[coef] if coef != 0 else -1 for coef in divisor]
+		result: list[int] = [0]
+		for factor in range(1, 256):
+			logfactor: int = _GF_LOG[factor]
+			result.append(int.from_bytes(bytes((_GF_EXP[lg + logfactor] if lg >= 0 else 0) for lg in logs), "big"))
+		return tuple(result)
 	
 	
 	@staticmethod
 	def _reed_solomon_compute_remainder(data: bytes, divisor: bytes) -> bytes:
-		"""Returns the Reed-Solomon error correction codeword for the given data and divisor polynomials."""
-		result = bytearray([0] * len(divisor))
+		"""Returns the Reed-Solomon error correction codeword for the given data and divisor polynomials.
+		The remainder is held in one integer, so each step is a shift and an XOR with a precomputed row."""
+		multiples: tuple[int,...] = QrCode._reed_solomon_divisor_multiples(bytes(divisor))
+		numbytes: int = len(divisor)
+		topshift: int = (numbytes - 1) * 8
+		mask: int = (1 << (numbytes * 8)) - 1
+		result: int = 0
 		for b in data:  # Polynomial division
-			factor: int = b ^ result.pop(0)
-			result.append(0)
-			for (i, coef) in enumerate(divisor):
-				result[i] ^= QrCode._reed_solomon_multiply(coef, factor)
-		return result
+			factor: int = b ^ (result >> topshift)
+			result = ((result << 8) & mask) ^ multiples[factor]
+		return result.to_bytes(numbytes, "big")
 	
 	
 	@staticmethod
 	def _reed_solomon_multiply(x: int, y: int) -> int:
 		"""Returns the product of the two given field elements modulo GF(2^8/0x11D). The arguments and result
-		are unsigned 8-bit integers. This could be implemented as a lookup table of 256*256 entries of uint8."""
+		are unsigned 8-bit integers. Uses the log/antilog tables, so no bit-serial multiplication is done."""
 		if (x >> 8 != 0) or (y >> 8 != 0):
 			raise ValueError("Byte out of range")
-		# Russian peasant multiplication
-		z: int = 0
-		for i in reversed(range(8)):
-			z = (z << 1) ^ ((z >> 7) * 0x11D)
-			z ^= ((y >> i) & 1) * x
-		assert z >> 8 == 0
-		return z
-	
-	
-	def _finder_penalty_count_patterns(self, runhistory: collections.deque[int]) -> int:
-		"""Can only be called immediately after a light run is added, and
-		returns either 0, 1, or 2. A helper function for _get_penalty_score()."""
-		n: int = runhistory[1]
-		assert n <= self._size * 3
-		core: bool = n > 0 and (runhistory[2] == runhistory[4] == runhistory[5] == n) and runhistory[3] == n * 3
-		return (1 if (core and runhistory[0] >= n * 4 and runhistory[6] >= n) else 0) \
-		     + (1 if (core and runhistory[6] >= n * 4 and runhistory[0] >= n) else 0)
-	
-	
-	def _finder_penalty_terminate_and_count(self, currentruncolor: bool, currentrunlength: int, runhistory: collections.deque[int]) -> int:
-		"""Must be called at the end of a line (row or column) of modules. A helper function for _get_penalty_score()."""
-		if currentruncolor:  # Terminate dark run
-			self._finder_penalty_add_history(currentrunlength, runhistory)
-			currentrunlength = 0
-		currentrunlength += self._size  # Add light border to final run
-		self._finder_penalty_add_history(currentrunlength, runhistory)
-		return self._finder_penalty_count_patterns(runhistory)
-	
-	
-	def _finder_penalty_add_history(self, currentrunlength: int, runhistory: collections.deque[int]) -> None:
-		if runhistory[0] == 0:
-			currentrunlength += self._size  # Add light border to initial run
-		runhistory.appendleft(currentrunlength)
+		if x == 0 or y == 0:
+			return 0
+		return _GF_EXP[_GF_LOG[x] + _GF_LOG[y]]
 	
 	
 	# ---- Constants and tables ----
@@ -597,6 +687,9 @@ class QrCode:
 	MIN_VERSION: int =  1  # The minimum version number supported in the QR Code Model 2 standard
 	MAX_VERSION: int = 40  # The maximum version number supported in the QR Code Model 2 standard
 	
+	# The version ranges in which every segment mode has the same character count field width.
+	_CHAR_COUNT_VERSION_RANGES: Sequence[tuple[int,int]] = ((1, 9), (10, 26), (27, 40))
+	
 	# For use in _get_penalty_score(), when evaluating which mask is best.
 	_PENALTY_N1: int =  3
 	_PENALTY_N2: int =  3
@@ -678,8 +771,7 @@ class QrSegment:
 		All input byte lists are acceptable. Any text string can be converted to
 		UTF-8 bytes (s.encode("UTF-8")) and encoded as a byte mode segment."""
 		bb = _BitBuffer()
-		for b in data:
-			bb.append_bits(b, 8)
+		bb.append_bytes(bytes(data))
 		return QrSegment(QrSegment.Mode.BYTE, len(data), bb)
 	
 	
@@ -730,6 +822,89 @@ class QrSegment:
 			return [QrSegment.make_bytes(text.encode("UTF-8"))]
 	
 	
+	@staticmethod
+	def make_segments_optimally(text: str, ecl: QrCode.Ecc, minversion: int = 1, maxversion: int = 40) -> list[QrSegment]:
+		"""Returns a new mutable list of zero or more segments to represent the given Unicode text string,
+		switching between numeric, alphanumeric and byte mode wherever that shortens the bit stream.
+		The segmentation is optimal for the smallest version within the given range that fits the
+		text at the given error correction level. Raises DataTooLongError if no version fits."""
+		if not (QrCode.MIN_VERSION <= minversion <= maxversion <= QrCode.MAX_VERSION):
+			raise ValueError("Invalid value")
+		if text == "":
+			return []
+		segs: list[QrSegment] = []
+		for version in range(minversion, maxversion + 1):
+			if (version == minversion) or (version in (10, 27)):  # The character count field widths change
+				segs = QrSegment._split_into_segments(text, QrSegment._compute_character_modes(text, version))
+			datausedbits: Optional[int] = QrSegment.get_total_bits(segs, version)
+			if (datausedbits is not None) and (datausedbits <= QrCode._get_data_capacity_bits(ecl)[version]):
+				return segs
+		raise DataTooLongError("Segment too long")
+	
+	
+	@staticmethod
+	def _compute_character_modes(text: str, version: int) -> list[QrSegment.Mode]:
+		"""Returns the mode of each character of the given non-empty text that gives the shortest bit stream
+		at the given version, found by dynamic programming over the modes. Costs are in 1/6 bits, so that
+		numeric (10 bits per 3 digits) and alphanumeric (11 bits per 2 characters) costs are integers."""
+		modes: tuple[QrSegment.Mode,...] = (QrSegment.Mode.BYTE, QrSegment.Mode.ALPHANUMERIC, QrSegment.Mode.NUMERIC)
+		headcosts: list[int] = [(4 + mode.num_char_count_bits(version)) * 6 for mode in modes]
+		
+		# charmodes[i][j] is the mode of character i on the cheapest path that is in modes[j] after character i
+		charmodes: list[list[Optional[QrSegment.Mode]]] = []
+		prevcosts: list[int] = list(headcosts)
+		for c in text:
+			curmodes: list[Optional[QrSegment.Mode]] = [None, None, None]
+			curcosts: list[int] = [0, 0, 0]
+			# Always extend a byte mode segment
+			curcosts[0] = prevcosts[0] + len(c.encode("UTF-8")) * 8 * 6
+			curmodes[0] = modes[0]
+			# Extend a segment if possible
+			if c in QrSegment._ALPHANUMERIC_ENCODING_TABLE:
+				curcosts[1] = prevcosts[1] + 33  # 5.5 bits per alphanumeric char
+				curmodes[1] = modes[1]
+			if "0" <= c <= "9":
+				curcosts[2] = prevcosts[2] + 20  # 3.33 bits per digit
+				curmodes[2] = modes[2]
+			# Start new segment at the end to switch modes
+			for j in range(len(modes)):  # To mode
+				for k in range(len(modes)):  # From mode
+					newcost: int = (curcosts[k] + 5) // 6 * 6 + headcosts[j]
+					if (curmodes[k] is not None) and ((curmodes[j] is None) or (newcost < curcosts[j])):
+						curcosts[j] = newcost
+						curmodes[j] = modes[k]
+			charmodes.append(curmodes)
+			prevcosts = curcosts
+		
+		# Find the optimal ending mode, then get the mode of each character by tracing backwards
+		curmode: Optional[QrSegment.Mode] = modes[min((j for j in range(len(modes)) if charmodes[-1][j] is not None), key=lambda j: prevcosts[j])]
+		result: list[QrSegment.Mode] = []
+		for curmodes in reversed(charmodes):
+			curmode = curmodes[modes.index(curmode)]
+			assert curmode is not None
+			result.append(curmode)
+		result.reverse()
+		return result
+	
+	
+	@staticmethod
+	def _split_into_segments(text: str, charmodes: Sequence[QrSegment.Mode]) -> list[QrSegment]:
+		"""Returns a list of segments, one per run of consecutive characters that have the same mode."""
+		result: list[QrSegment] = []
+		start: int = 0
+		for (mode, group) in itertools.groupby(charmodes):
+			end: int = start + sum(1 for _ in group)
+			run: str = text[start : end]
+			if mode is QrSegment.Mode.NUMERIC:
+				result.append(QrSegment.make_numeric(run))
+			elif mode is QrSegment.Mode.ALPHANUMERIC:
+				result.append(QrSegment.make_alphanumeric(run))
+			else:
+				result.append(QrSegment.make_bytes(run.encode("UTF-8")))
+			start = end
+		return result
+	
+	
 	@staticmethod
 	def make_eci(assignval: int) -> QrSegment:
 		"""Returns a segment representing an Extended Channel Interpretation
@@ -776,21 +951,21 @@ class QrSegment:
 	# Accessed through get_num_chars().
 	_numchars: int
 	
-	# The data bits of this segment. Accessed through get_data().
-	_bitdata: list[int]
+	# The data bits of this segment, packed. Accessed through get_data().
+	_bitdata: _BitBuffer
 	
 	
 	# ---- Constructor (low level) ----
 	
-	def __init__(self, mode: QrSegment.Mode, numch: int, bitdata: Sequence[int]) -> None:
+	def __init__(self, mode: QrSegment.Mode, numch: int, bitdata: Union[_BitBuffer,Sequence[int]]) -> None:
 		"""Creates a new QR Code segment with the given attributes and data.
 		The character count (numch) must agree with the mode and the bit buffer length,
-		but the constraint isn't checked. The given bit buffer is cloned and stored."""
+		but the constraint isn't checked. The given bit buffer (or sequence of 0s and 1s) is cloned and stored."""
 		if numch < 0:
 			raise ValueError()
 		self._mode = mode
 		self._numchars = numch
-		self._bitdata = list(bitdata)  # Make defensive copy
+		self._bitdata = _BitBuffer(bitdata)  # Make defensive copy
 	
 	
 	# ---- Accessor methods ----
@@ -805,7 +980,7 @@ class QrSegment:
 	
 	def get_data(self) -> list[int]:
 		"""Returns a new copy of the data bits of this segment."""
-		return list(self._bitdata)  # Make defensive copy
+		return self._bitdata.to_list()
 	
 	
 	# Package-private function
@@ -877,15 +1052,68 @@ class QrSegment:
 
 # ---- Private helper class ----
 
-class _BitBuffer(list[int]):
-	"""An appendable sequence of bits (0s and 1s). Mainly used by QrSegment."""
+class _BitBuffer:
+	"""An appendable sequence of bits (0s and 1s), packed big endian into a single
+	integer instead of one list element per bit. Mainly used by QrSegment."""
+	
+	_value: int  # The bits, with the first appended bit as the most significant one
+	_length: int  # The number of bits, including leading zeros not visible in _value
+	
+	def __init__(self, bits: Union[_BitBuffer,Sequence[int]] = ()) -> None:
+		"""Creates a buffer holding a copy of the given bits."""
+		if isinstance(bits, _BitBuffer):
+			self._value = bits._value
+			self._length = bits._length
+		else:
+			self._length = len(bits)
+			self._value = int("".join(("1" if bit else "0") for bit in bits), 2) if self._length > 0 else 0
+	
+	def __len__(self) -> int:
+		return self._length
 	
 	def append_bits(self, val: int, n: int) -> None:
 		"""Appends the given number of low-order bits of the given
 		value to this buffer. Requires n >= 0 and 0 <= val < 2^n."""
 		if (n < 0) or (val >> n != 0):
 			raise ValueError("Value out of range")
-		self.extend(((val >> i) & 1) for i in reversed(range(n)))
+		self._value = (self._value << n) | val
+		self._length += n
+	
+	def append_bytes(self, data: bytes) -> None:
+		"""Appends all bits of the given bytes, most significant bit first."""
+		self._value = (self._value << (len(data) * 8)) | int.from_bytes(data, "big")
+		self._length += len(data) * 8
+	
+	def append_buffer(self, other: _BitBuffer) -> None:
+		"""Appends all bits of the given buffer."""
+		self._value = (self._value << other._length) | other._value
+		self._length += other._length
+	
+	def to_bytes(self) -> bytes:
+		"""Returns the bits packed into bytes in big endian. Requires the length to be a multiple of 8."""
+		assert self._length % 8 == 0
+		return self._value.to_bytes(self._length // 8, "big")
+	
+	def to_list(self) -> list[int]:
+		"""Returns a new list of the bits, one element per bit."""
+		return [((self._value >> i) & 1) for i in reversed(range(self._length))]
+
+
+def _make_gf_tables() -> tuple[bytes,bytes]:
+	"""Returns the antilog and log tables of GF(2^8/0x11D) with generator 0x02. The antilog
+	table is stored twice in a row so that exp[log[x] + log[y]] never needs a modulo."""
+	exp = bytearray(510)
+	log = bytearray(256)  # log[0] is undefined and left as 0
+	x: int = 1
+	for i in range(255):
+		exp[i] = exp[i + 255] = x
+		log[x] = i
+		x <<= 1
+		if x >> 8 != 0:
+			x ^= 0x11D
+	return (bytes(exp), bytes(log))
+
+_GF_EXP, _GF_LOG = _make_gf_tables()
 
 
 def _get_bit(x: int, i: int) -> bool:
@@ -893,6 +1121,33 @@ def _get_bit(x: int, i: int) -> bool:
 	return (x >> i) & 1 != 0
 
 
+# Maps the ASCII digits "0" and "1" to the bytes 0 and 1, for use as itertools.compress() selectors
+_BIT_SELECTORS: bytes = bytes.maketrans(b"01", b"\x00\x01")
+
+
+def _popcount(x: int) -> int:
+	"""Returns the number of bits set to 1 in the given non-negative integer."""
+	return bin(x).count("1")
+
+
+def _runs_of_ones(bits: int, n: int) -> int:
+	"""Returns a mask with bit i set iff bits i to i + n - 1 of the given integer are all 1."""
+	result: int = bits
+	length: int = 1
+	while length < n:
+		step: int = min(length, n - length)
+		result &= result >> step
+		length += step
+	return result
+
+
+def _transpose(rows: Sequence[int], size: int) -> list[int]:
+	"""Returns the columns of the given packed square grid, packed one integer per column
+	the same way (bit y of column x is the module at (x, y))."""
+	lines: list[str] = [format(row, f"0{size}b")[::-1] for row in rows]  # lines[y][x] is the module at (x, y)
+	return [int("".join(col)[::-1], 2) for col in zip(*lines)]
+
+
 
 class DataTooLongError(ValueError):
 	"""Raised when the supplied data does not fit any QR Code version. Ways to handle this exception include:
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+__author__ = 'Sanda Takeru'
+__date__ = '2024-07-17'
+__copyright__ = '(C) 2024 by Sanda Takeru'
+__revision__ = '$Format:%H$'
+
+# 巡回順の最適化（最近傍法 + 2-opt）、Google Mapsの地点数上限に合わせた経路の分割と地点のクラスタリング。QGIS/Qtに依存しない
+
+import math, heapq, collections
+
+# 地球の平均半径(m)
+EARTH_RADIUS = 6371008.8
+
+# 2-optで入れ替え先の候補にする近傍の地点数
+NEIGHBOUR_COUNT = 10
+
+def haversineDistance(lons, lats):
+    # WGS84経緯度の2地点間の大円距離(m)を返す関数。三角関数は地点ごとに1回だけ計算しておく
+    phis = [math.radians(lat) for lat in lats]
+    lams = [math.radians(lon) for lon in lons]
+    cos_phis = [math.cos(phi) for phi in phis]
+    diameter = 2.0 * EARTH_RADIUS
+    sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+    def distance(i, j):
+        return diameter * asin(min(1.0, sqrt(sin((phis[j] - phis[i]) / 2.0) ** 2 + cos_phis[i] * cos_phis[j] * sin((lams[j] - lams[i]) / 2.0) ** 2)))
+    return distance
+
+def routeLength(order, distance):
+    return sum(distance(a, b) for a, b in zip(order, order[1:]))
+
+def _planarCoordinates(lons, lats):
+    # 経度を平均緯度で縮めた平面座標(度)。近傍探索の順位付けにだけ使い、経路長は大円距離で測る
+    k = math.cos(math.radians(sum(lats) / len(lats)))
+    return [lon * k for lon in lons], list(lats)
+
+def nearestNeighbourRoute(xs, ys, start=0):
+    # startから、まだ訪れていない最も近い地点へ順に進む。未訪問の地点はkd木から削除しながら探す
+    tree = _PointTree(xs, ys)
+    tree.remove(start)
+    order = [start]
+    for _n in range(len(xs) - 1):
+        _d, nearest = tree.nearest(xs[order[-1]], ys[order[-1]], 1)[0]
+        tree.remove(nearest)
+        order.append(nearest)
+    return order
+
+def twoOpt(order, distance, neighbours, fixed_start=True, max_passes=50, is_canceled=None):
+    # 始点と終点を結ばない(戻らない)経路の2-opt。区間order[p..q]を反転して短くなる限り繰り返す
+    # 入れ替え先は各地点の近傍(neighbours)に限り、改善しなかった地点は周りの辺が変わるまで調べない(don't-look bits)
+    # fixed_startなら先頭(デポ)は動かさない。終点は常に自由
+    # 地点数分の確認を1パスとし、パスごとにis_canceled()がTrueなら、その時点の経路を返す
+    order = list(order)
+    n = len(order)
+    last = n - 1
+    first = 1 if fixed_start else 0
+    position = [0] * n
+    for index, point in enumerate(order):
+        position[point] = index
+
+    def gain(p, q):
+        # order[p..q]を反転したときの短縮量。外す辺 (p-1, p), (q, q+1) と足す辺 (p-1, q), (p, q+1)
+        if p < first or q <= p or (p == 0 and q == last):
+            return 0.0
+        a, b, c = order[p - 1] if p > 0 else None, order[p], order[q]
+        e = order[q + 1] if q < last else None
+        delta = 0.0
+        if a is not None:
+            delta += distance(a, b) - distance(a, c)
+        if e is not None:
+            delta += distance(c, e) - distance(b, e)
+        return delta
+
+    active = collections.deque(order)
+    queued = bytearray([1]) * n
+    checks = 0
+    while active and checks < max_passes * n:
+        if checks % n == 0 and is_canceled is not None and is_canceled():
+            break
+        checks += 1
+        point = active.popleft()
+        queued[point] = 0
+        best_gain, best_move = 1e-9, None
+        i = position[point]
+        for neighbour in neighbours[point]:
+            j = position[neighbour]
+            # pointとneighbourを隣り合わせる2通りの反転（後ろの辺どうし、前の辺どうしを入れ替える）
+            moves = ((i + 1, j), (i, j - 1)) if i < j else ((j + 1, i), (j, i - 1))
+            for p, q in moves:
+                delta = gain(p, q)
+                if delta > best_gain:
+                    best_gain, best_move = delta, (p, q)
+        if best_move is None:
+            continue
+        p, q = best_move
+        order[p:q + 1] = order[p:q + 1][::-1]
+        for index in range(p, q + 1):
+            position[order[index]] = index
+        # 辺が変わった地点（pointを含む）を調べ直す
+        for index in (p - 1, p, q, q + 1):
+            if 0 <= index < n:
+                changed = order[index]
+                if not queued[changed]:
+                    queued[changed] = 1
+                    active.append(changed)
+    return order
+
+def optimizeRoute(lons, lats, fixed_start=False, is_canceled=None):
+    # 巡回順(地点番号のリスト)を返す。fixed_startなら0番の地点(デポ)から出発する
+    n = len(lons)
+    if n < 3:
+        return list(range(n))
+    distance = haversineDistance(lons, lats)
+    xs, ys = _planarCoordinates(lons, lats)
+    # 各地点の近傍は、自分を含めて最も近いNEIGHBOUR_COUNT+1個から自分を除いたもの
+    tree = _PointTree(xs, ys)
+    neighbours = [[j for _d, j in tree.nearest(xs[i], ys[i], NEIGHBOUR_COUNT + 1) if j != i] for i in range(n)]
+    if fixed_start:
+        start = 0
+    else:
+        # 出発地が自由なら、全体の重心から最も遠い地点(端にある地点)から始める
+        mean_lon, mean_lat = sum(lons) / n, sum(lats) / n
+        start = max(range(n), key=lambda i: (lons[i] - mean_lon) ** 2 + (lats[i] - mean_lat) ** 2)
+    return twoOpt(nearestNeighbourRoute(xs, ys, start), distance, neighbours, fixed_start, is_canceled=is_canceled)
+
+def splitRoute(stops, max_points=10, current_location=False):
+    # max_points地点ずつの区間に分ける。2つ目以降の区間は前の区間の最後の地点から出発する
+    # 現在地スタートでは、最初の区間は現在地(URL上は空の出発地)が1地点を使う
+    end = max_points - 1 if current_location else max_points
+    legs = [stops[:end]]
+    while end < len(stops):
+        start = end - 1
+        end = start + max_points
+        legs.append(stops[start:end])
+    return legs
+
+# kd木の葉に入れる地点数
+KD_LEAF_SIZE = 16
+
+class _PointTree:
+    # 地点を削除できるkd木。分割は件数の中央で行うので、地点が一部に密集していても深さはlog(n)に収まる
+    # 各ノードは自分より下の未削除の地点数を持ち、すべて削除されたノードは探索しない
+    def __init__(self, xs, ys):
+        self.xs, self.ys = xs, ys
+        n = len(xs)
+        self.points = list(range(n))
+        self.leaf_of = [0] * n
+        self.removed = bytearray(n)
+        # ノードごとの値: 地点の範囲(points[lo:hi])、子(葉は-1)、親、未削除の地点数、外接矩形
+        self.lo, self.hi, self.left, self.right, self.parent, self.alive = [], [], [], [], [], []
+        self.min_x, self.max_x, self.min_y, self.max_y = [], [], [], []
+        self._build(0, n, -1)
+
+    def _build(self, lo, hi, parent):
+        # 再帰を使わず、スタックで上から順にノードを作る
+        stack = [(lo, hi, parent, None)]
+        xs, ys, points = self.xs, self.ys, self.points
+        while stack:
+            lo, hi, parent, side = stack.pop()
+            node = len(self.lo)
+            members = points[lo:hi]
+            node_xs = [xs[i] for i in members]
+            node_ys = [ys[i] for i in members]
+            self.lo.append(lo)
+            self.hi.append(hi)
+            self.parent.append(parent)
+            self.alive.append(hi - lo)
+            self.min_x.append(min(node_xs))
+            self.max_x.append(max(node_xs))
+            self.min_y.append(min(node_ys))
+            self.max_y.append(max(node_ys))
+            self.left.append(-1)
+            self.right.append(-1)
+            if side is not None:
+                (self.left if side == 0 else self.right)[parent] = node
+            if hi - lo <= KD_LEAF_SIZE:
+                for i in members:
+                    self.leaf_of[i] = node
+                continue
+            # 広がりの大きい軸で、件数の半分ずつに分ける（同じ座標の地点が多くても偏らない）
+            coords = xs if self.max_x[node] - self.min_x[node] >= self.max_y[node] - self.min_y[node] else ys
+            members.sort(key=coords.__getitem__)
+            points[lo:hi] = members
+            mid = (lo + hi) // 2
+            stack.append((mid, hi, node, 1))
+            stack.append((lo, mid, node, 0))
+
+    def nearest(self, x, y, k):
+        # 未削除の地点のうち(x, y)に近いk個を、近い順に(距離の2乗, 地点番号)で返す
+        # 近いノードから順に開き、k番目の距離より遠いノードに達したら打ち切る
+        xs, ys, points, removed = self.xs, self.ys, self.points, self.removed
+        left, right, alive = self.left, self.right, self.alive
+        min_x, max_x, min_y, max_y = self.min_x, self.max_x, self.min_y, self.max_y
+        heappush, heappop, heapreplace = heapq.heappush, heapq.heappop, heapq.heapreplace
+        nodes = [(0.0, 0)]
+        best = []  # (-距離の2乗, -地点番号)。先頭が現在のk番目
+        while nodes:
+            distance, node = heappop(nodes)
+            if len(best) == k and distance > -best[0][0]:
+                break
+            if left[node] < 0:
+                for i in points[self.lo[node]:self.hi[node]]:
+                    if removed[i]:
+                        continue
+                    entry = (-((xs[i] - x) ** 2 + (ys[i] - y) ** 2), -i)
+                    if len(best) < k:
+                        heappush(best, entry)
+                    elif entry > best[0]:
+                        heapreplace(best, entry)
+                continue
+            for child in (left[node], right[node]):
+                if alive[child]:
+                    # 子ノードの外接矩形までの距離の2乗（矩形の中なら0）
+                    dx = min_x[child] - x if x < min_x[child] else (x - max_x[child] if x > max_x[child] else 0.0)
+                    dy = min_y[child] - y if y < min_y[child] else (y - max_y[child] if y > max_y[child] else 0.0)
+                    heappush(nodes, (dx * dx + dy * dy, child))
+        return sorted((-d, -i) for d, i in best)
+
+    def remove(self, i):
+        self.removed[i] = 1
+        node = self.leaf_of[i]
+        while node >= 0:
+            self.alive[node] -= 1
+            node = self.parent[node]
+
+def capacitatedClusters(lons, lats, capacity):
+    # 近い地点どうしをcapacity個以下ずつのまとまりに分け、まとまり(地点番号のリスト)を1つずつ返すジェネレータ
+    # 呼び出し側は受け取るたびに中断や進捗を確認できる
+    # 削除できるkd木で未割り当ての近い地点を探すので、1つのまとまりの探索は地点の偏りによらずcapacityと木の深さ程度で済む
+    n = len(lons)
+    if n == 0:
+        return
+    # 経度は平均緯度で縮めた平面座標(度)で距離を比べる
+    k = math.cos(math.radians(sum(lats) / n))
+    xs = [lon * k for lon in lons]
+    ys = list(lats)
+    tree = _PointTree(xs, ys)
+
+    # 種点は、x順に同じ件数ずつ分けた列を、偶数列は下から、奇数列は上から（蛇行）選ぶと、残った地点が散らばりにくい
+    # 列の幅は件数で決めるので、地点が密集した場所ほど細かい列になる
+    columns = max(1, math.isqrt(n // capacity))
+    by_x = sorted(range(n), key=xs.__getitem__)
+    column_of = [0] * n
+    for rank, i in enumerate(by_x):
+        column_of[i] = rank * columns // n
+    seeds = sorted(range(n), key=lambda i: (column_of[i], ys[i] if column_of[i] % 2 == 0 else -ys[i]))
+    for seed in seeds:
+        # 同じ座標の地点が多いと種点自身が選ばれないことがあるので、種点が割り当てられるまで繰り返す
+        while not tree.removed[seed]:
+            members = [i for _d, i in tree.nearest(xs[seed], ys[seed], capacity)]
+            for i in members:
+                tree.remove(i)
+            yield members